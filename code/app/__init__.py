@@ -1,22 +1,26 @@
 from flask import Flask
 from flask_bootstrap import Bootstrap
 import os
+import time
 from config import Config
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_wtf import FlaskForm
-import spacy
-from spacy.matcher import Matcher, PhraseMatcher
 from flask_apscheduler import APScheduler
+from flask_migrate import Migrate
+from app.model_registry import ModelRegistry
+from app.startup import Startup
 
+_import_begin = time.perf_counter()
 
 # Initialization
 application = Flask(__name__)
 application.secret_key = os.urandom(24)
 application.config.from_object(Config)
 db = SQLAlchemy(application)
-db.create_all()
-db.session.commit()
+# schema changes: flask db migrate / flask db upgrade (see migrations/)
+migrate = Migrate(application, db, directory=os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, 'migrations'))
 
 Bootstrap(application)
 
@@ -24,18 +28,74 @@ Bootstrap(application)
 login_manager = LoginManager()
 login_manager.init_app(application)
 
-# load the spacy model
+# scheduler for periodic jobs, started by warm_up()
+scheduler = APScheduler()
+scheduler.init_app(application)
+
+# the spacy model is loaded on first use or by warm_up(); retrained
+# versions are swapped in while running
 par_dir = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
 par_dir += "/models"
-for root, dirs, files in os.walk(par_dir):
-    model_dir = "{}/{}".format(par_dir, dirs[0])
-    break
-spacy_model = spacy.load(model_dir)
+model_registry = ModelRegistry(par_dir)
+
+# readiness reported by /health
+startup = Startup()
+
+
+# schema of databases created by db.create_all() before migrations existed
+BASELINE_REVISION = '5d2c7a1e9f03'
+
+
+def create_tables():
+    """Create the schema on an empty database and stamp it with the newest
+    migration. A database created before migrations existed is stamped with
+    the baseline revision, so `flask db upgrade` applies only the changes
+    since. Existing tables are only changed by `flask db upgrade`"""
+    from flask_migrate import stamp
+    from sqlalchemy import inspect
+
+    tables = inspect(db.engine).get_table_names()
+    if not tables:
+        db.create_all()
+        db.session.commit()
+        with application.app_context():
+            stamp()
+    elif 'alembic_version' not in tables:
+        with application.app_context():
+            stamp(revision=BASELINE_REVISION)
+
+
+def load_model():
+    model_registry.current()
+
+
+def start_scheduler():
+    from app import nlp  # registers the scheduled jobs
+    scheduler.start()
+
+
+def start_workers():
+    from app import nlp
+    nlp.start_workers()
+
+
+def warm_up(background=False):
+    """Create the tables, load the model, start the upload job workers
+    (forking the NLP processes first) and the scheduler.
+
+    Nothing heavy happens at import time, so CLI tools and tests that only
+    need the models or forms never load spaCy; the web entry point calls
+    this once. With background=True the app serves /health (reporting
+    'warming') while the steps run."""
+    return startup.run([('create_all', create_tables),
+                        ('model', load_model),
+                        ('workers', start_workers),
+                        ('scheduler', start_scheduler)],
+                       background=background)
 
-# start scheduler
-scheduler = APScheduler()
-scheduler.init_app(application)
-scheduler.start()
 
 from app import classes
+from app import query_plans  # registers `flask check-query-plans`
 from app import routes  # Added at the bottom to avoid circular dependencies
+
+startup.record('import', time.perf_counter() - _import_begin)
@@ -0,0 +1,182 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+
+
+class _Call(object):
+    """One recognize() call on the backend's executor. The timeout clock
+    starts when a thread picks the call up, so time spent queued behind
+    other calls never counts against it"""
+
+    def __init__(self, executor, recognize, source):
+        self.started = threading.Event()
+        self.started_at = None
+        self.future = executor.submit(self._run, recognize, source)
+
+    def _run(self, recognize, source):
+        self.started_at = time.monotonic()
+        self.started.set()
+        return recognize(source)
+
+    def result(self, timeout=None):
+        if timeout is None:
+            return self.future.result()
+        self.started.wait()
+        elapsed = time.monotonic() - self.started_at
+        return self.future.result(max(0.0, timeout - elapsed))
+
+    def cancel(self):
+        return self.future.cancel()
+
+
+class ASRBackend(object):
+    """Speech-to-text backend used by transcribe().
+
+    Subclasses implement recognize(source), where source is a WAV file path
+    or file-like object. At most max_concurrency calls run at once; more
+    wait in the executor's queue. transcribe() raises
+    concurrent.futures.TimeoutError when a call has been running for more
+    than timeout seconds (None waits forever); waiting in the queue does
+    not count.
+
+    A timed-out call is only abandoned: Python cannot stop a running
+    thread, so it holds its slot until the engine returns. Calls still
+    queued are cancelled. The Google backend bounds its request with the
+    same timeout; Sphinx runs locally and has no limit of its own."""
+
+    name = None
+
+    def __init__(self, max_concurrency=4, timeout=None):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_concurrency)
+
+    def _submit(self, source):
+        return _Call(self._executor, self.recognize, source)
+
+    def transcribe(self, source):
+        call = self._submit(source)
+        try:
+            return call.result(self.timeout)
+        except Exception:
+            call.cancel()
+            raise
+
+    def transcribe_segments(self, segments, max_pending=None, source=None):
+        """Transcribe a stream of recording segments concurrently and join
+        the text in order. At most max_pending segments (default twice the
+        concurrency) are read ahead, so memory stays bounded however long
+        the recording is. source is the path of the recording the segments
+        come from, for backends that need it"""
+        max_pending = max_pending or 2 * self.max_concurrency
+        pending = deque()
+        texts = []
+        try:
+            for segment in segments:
+                pending.append(self._submit(segment))
+                if len(pending) >= max_pending:
+                    texts.append(pending.popleft().result(self.timeout))
+            while pending:
+                texts.append(pending.popleft().result(self.timeout))
+        except Exception:
+            for call in pending:
+                call.cancel()
+            raise
+        return " ".join(text for text in texts if text)
+
+    def recognize(self, source):
+        raise NotImplementedError
+
+
+class GoogleBackend(ASRBackend):
+    """Google Web Speech API through speech_recognition (network)"""
+
+    name = 'google'
+
+    def recognize(self, source):
+        import speech_recognition as sr
+
+        r = sr.Recognizer()
+        # let a stuck request fail instead of holding a slot forever
+        r.operation_timeout = self.timeout
+        with sr.AudioFile(source) as audio_source:
+            audio = r.record(audio_source)
+        return r.recognize_google(audio)
+
+
+class SphinxBackend(ASRBackend):
+    """CMU PocketSphinx through speech_recognition (offline)"""
+
+    name = 'sphinx'
+
+    def recognize(self, source):
+        import speech_recognition as sr
+
+        r = sr.Recognizer()
+        with sr.AudioFile(source) as audio_source:
+            audio = r.record(audio_source)
+        return r.recognize_sphinx(audio)
+
+
+class FixtureBackend(ASRBackend):
+    """Deterministic stand-in that needs no network or audio model.
+
+    For a recording 'visit.wav' it returns the text of 'visit.txt' in
+    fixture_dir (or next to the recording), otherwise `default`. latency
+    adds a fixed delay per call to mimic a real engine under load tests."""
+
+    name = 'fixture'
+
+    def __init__(self, max_concurrency=4, timeout=None, fixture_dir=None,
+                 default="", latency=0.0):
+        super(FixtureBackend, self).__init__(max_concurrency, timeout)
+        self.fixture_dir = fixture_dir
+        self.default = default
+        self.latency = latency
+
+    def recognize(self, source):
+        if self.latency:
+            time.sleep(self.latency)
+        if not isinstance(source, str):
+            return self.default
+        return self.fixture(source)
+
+    def transcribe_segments(self, segments, max_pending=None, source=None):
+        """Segments carry no name to look a fixture up by: they still go
+        through recognize() for its latency, but the text is the fixture
+        of the whole recording at source"""
+        text = super(FixtureBackend, self).transcribe_segments(
+            segments, max_pending)
+        return text if source is None else self.fixture(source)
+
+    def fixture(self, path):
+        """Text of the fixture for the recording at path, or default"""
+        stem = os.path.splitext(path)[0]
+        if self.fixture_dir:
+            stem = os.path.join(self.fixture_dir, os.path.basename(stem))
+        try:
+            with open(stem + '.txt') as f:
+                return f.read()
+        except IOError:
+            return self.default
+
+
+BACKENDS = {backend.name: backend
+            for backend in (GoogleBackend, SphinxBackend, FixtureBackend)}
+
+
+def make_backend(config):
+    """ASR backend selected by ASR_BACKEND, with its concurrency limit and
+    per-call timeout"""
+    name = config.get('ASR_BACKEND', 'google')
+    if name not in BACKENDS:
+        raise ValueError("Unknown ASR_BACKEND: {}".format(name))
+    options = {'max_concurrency': config.get('ASR_MAX_CONCURRENCY', 4),
+               'timeout': config.get('ASR_TIMEOUT')}
+    if name == 'fixture':
+        options.update(fixture_dir=config.get('ASR_FIXTURE_DIR'),
+                       default=config.get('ASR_FIXTURE_TEXT', ""),
+                       latency=config.get('ASR_FIXTURE_LATENCY', 0.0))
+    return BACKENDS[name](**options)
@@ -0,0 +1,191 @@
+import audioop
+import contextlib
+import io
+import numpy
+import wave
+
+# Segments sent to the ASR backend; the search window lets a cut move to
+# the quietest point nearby so words aren't split between segments.
+SEGMENT_SECONDS = 30
+SEARCH_SECONDS = 2.0
+_STEP_SECONDS = 0.01
+
+
+def duration(path):
+    """Length of a WAV recording in seconds, read from its header"""
+    with contextlib.closing(wave.open(path, 'rb')) as wav:
+        return wav.getnframes() / float(wav.getframerate())
+
+
+def iter_segments(path, seconds=SEGMENT_SECONDS,
+                  search_seconds=SEARCH_SECONDS, preprocess=None):
+    """Stream a WAV recording as in-memory WAV files of about `seconds`
+    (None sends the whole recording as one segment).
+
+    Each cut is placed at the quietest 10 ms within search_seconds of the
+    target length (0 cuts at exactly `seconds`). Only one segment plus the
+    search window is held in memory at a time. A `preprocess` callable,
+    such as a Preprocessor, turns each segment's frames into the WAV file
+    that is yielded; segments it returns None for are skipped."""
+    with contextlib.closing(wave.open(path, 'rb')) as wav:
+        params = wav.getparams()
+        for frames in _iter_frames(wav, seconds, search_seconds):
+            if preprocess is None:
+                yield _wav_file(frames, params.nchannels, params.sampwidth,
+                                params.framerate)
+            else:
+                segment = preprocess(frames, params)
+                if segment is not None:
+                    yield segment
+
+
+def _iter_frames(wav, seconds, search_seconds):
+    rate = wav.getframerate()
+    width = wav.getsampwidth()
+    frame_bytes = width * wav.getnchannels()
+    if not seconds:
+        yield wav.readframes(wav.getnframes())
+        return
+    target = max(1, int(seconds * rate))
+    search = min(int(search_seconds * rate), target // 2)
+    buffer = b''
+    while True:
+        wanted = target + search - len(buffer) // frame_bytes
+        data = wav.readframes(wanted)
+        buffer += data
+        if len(data) < wanted * frame_bytes:
+            break
+        cut = _quietest(buffer, width, frame_bytes, target - search,
+                        target + search, max(1, int(rate * _STEP_SECONDS)))
+        yield buffer[:cut * frame_bytes]
+        buffer = buffer[cut * frame_bytes:]
+    if buffer:
+        yield buffer
+
+
+def _quietest(buffer, width, frame_bytes, low, high, step):
+    """Frame index in [low, high] at the centre of the quietest step"""
+    if high <= low:
+        return high
+    best, best_rms = high, None
+    for start in range(low, high - step + 1, step):
+        rms = audioop.rms(buffer[start * frame_bytes:
+                                 (start + step) * frame_bytes], width)
+        if best_rms is None or rms < best_rms:
+            best, best_rms = start + step // 2, rms
+    return best
+
+
+def _wav_file(frames, channels, width, rate):
+    """In-memory WAV file holding frames in the given format"""
+    out = io.BytesIO()
+    with contextlib.closing(wave.open(out, 'wb')) as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(width)
+        wav.setframerate(rate)
+        wav.writeframes(frames)
+    out.seek(0)
+    return out
+
+
+class Preprocessor(object):
+    """Audio clean-up before ASR, on NumPy sample buffers: downmix to mono,
+    resample to the rate the ASR expects and compress silences found by
+    energy-based voice activity detection.
+
+    One instance handles one recording (segment by segment) and reports
+    how much audio it removed."""
+
+    def __init__(self, rate=16000, silence_db=-40.0, max_silence=0.3,
+                 frame_seconds=0.03):
+        self.rate = rate
+        self.silence_db = silence_db
+        self.max_silence = max_silence
+        self.frame_seconds = frame_seconds
+        self.input_seconds = 0.0
+        self.output_seconds = 0.0
+
+    @property
+    def removed_seconds(self):
+        return self.input_seconds - self.output_seconds
+
+    def __call__(self, frames, params):
+        samples = to_samples(frames, params.sampwidth, params.nchannels)
+        self.input_seconds += len(samples) / float(params.framerate)
+        mono = samples.mean(axis=1)
+        mono = resample(mono, params.framerate, self.rate)
+        mono = compress_silence(mono, self.rate, self.silence_db,
+                                self.max_silence, self.frame_seconds)
+        self.output_seconds += len(mono) / float(self.rate)
+        if not len(mono):
+            return None
+        return _wav_file(to_pcm16(mono), 1, 2, self.rate)
+
+    def report(self):
+        return {'input_seconds': self.input_seconds,
+                'output_seconds': self.output_seconds,
+                'removed_seconds': self.removed_seconds}
+
+
+def to_samples(frames, width, channels):
+    """PCM frames as float32 samples in [-1, 1], shape (n, channels)"""
+    if width == 1:
+        data = numpy.frombuffer(frames, numpy.uint8).astype(numpy.float32)
+        data = (data - 128) / 128
+    elif width == 3:
+        raw = numpy.frombuffer(frames, numpy.uint8).reshape(-1, 3)
+        ints = raw[:, 0].astype(numpy.int32) | \
+            (raw[:, 1].astype(numpy.int32) << 8) | \
+            (raw[:, 2].astype(numpy.int32) << 16)
+        ints = numpy.where(ints & 0x800000, ints - 0x1000000, ints)
+        data = ints.astype(numpy.float32) / 2 ** 23
+    else:
+        dtype = {2: '<i2', 4: '<i4'}[width]
+        data = numpy.frombuffer(frames, dtype).astype(numpy.float32)
+        data /= 2 ** (8 * width - 1)
+    return data.reshape(-1, channels)
+
+
+def to_pcm16(samples):
+    """Float samples in [-1, 1] as 16-bit little-endian PCM frames"""
+    return (numpy.clip(samples, -1, 1) * 32767).astype('<i2').tobytes()
+
+
+def resample(samples, rate, target):
+    """Linear-interpolation resampling of mono samples. Downsampling first
+    averages over the rate ratio to keep aliasing out of the speech band"""
+    if rate == target or not len(samples):
+        return samples
+    ratio = rate / float(target)
+    width = int(round(ratio))
+    if width > 1:
+        samples = numpy.convolve(samples, numpy.ones(width) / width, 'same')
+    count = int(len(samples) / ratio)
+    positions = numpy.arange(count) * ratio
+    return numpy.interp(positions, numpy.arange(len(samples)),
+                        samples).astype(numpy.float32)
+
+
+def compress_silence(samples, rate, silence_db=-40.0, max_silence=0.3,
+                     frame_seconds=0.03):
+    """Shorten every silent stretch to at most max_silence seconds.
+
+    A frame is silent when its RMS level is below silence_db (dBFS); the
+    first max_silence seconds of each silent run are kept so pauses between
+    words remain audible to the ASR."""
+    frame = max(1, int(rate * frame_seconds))
+    count = len(samples) // frame
+    if not count:
+        return samples
+    framed = samples[:count * frame].reshape(count, frame)
+    rms = numpy.sqrt(numpy.mean(numpy.square(framed), axis=1))
+    silent = 20 * numpy.log10(numpy.maximum(rms, 1e-10)) < silence_db
+
+    # position of each frame within its silent run
+    index = numpy.arange(count)
+    run_start = numpy.maximum.accumulate(numpy.where(silent, 0, index + 1))
+    kept_frames = max(1, int(max_silence / frame_seconds))
+    keep = ~silent | (index - run_start < kept_frames)
+    mask = numpy.ones(len(samples), dtype=bool)
+    mask[:count * frame] = numpy.repeat(keep, frame)
+    return samples[mask]
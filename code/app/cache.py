@@ -0,0 +1,226 @@
+from app import metrics
+from app.matchers import model_version
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+
+
+class MemoryBackend(object):
+    """LRU store of serialized results held in this process"""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+
+    def trim(self, max_entries):
+        """Drop least recently used entries down to max_entries; returns
+        how many were dropped"""
+        evicted = 0
+        while len(self._entries) > max_entries:
+            self._entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def use_version(self, version, previous):
+        self.clear()
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskBackend(object):
+    """LRU store of serialized results, one file per entry in a
+    subdirectory of `directory` per model version. Recency is the file
+    mtime. The directory is shared by every process using it (gunicorn
+    workers, NLP processes, restarts), so the size bound and clearing
+    rescan it instead of trusting what this process wrote"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.version_dir = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.version_dir, key + '.json')
+
+    def _entries(self):
+        """[(mtime, key)] of the entries of this version, by any process"""
+        try:
+            names = os.listdir(self.version_dir)
+        except (OSError, TypeError):
+            return []
+        entries = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                mtime = os.path.getmtime(os.path.join(self.version_dir, name))
+            except OSError:
+                continue  # removed by another process meanwhile
+            entries.append((mtime, name[:-5]))
+        return entries
+
+    def _remove(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                value = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return value
+
+    def set(self, key, value):
+        # another process may have removed this version meanwhile
+        os.makedirs(self.version_dir, exist_ok=True)
+        path = self._path(key)
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(temp_path, 'w') as f:
+            f.write(value)
+        os.replace(temp_path, path)
+
+    def trim(self, max_entries):
+        """Remove the least recently used files down to max_entries;
+        returns how many were removed"""
+        entries = self._entries()
+        if len(entries) <= max_entries:
+            return 0
+        entries.sort()
+        oldest = entries[:len(entries) - max_entries]
+        for _, key in oldest:
+            self._remove(key)
+        return len(oldest)
+
+    def use_version(self, version, previous):
+        """Store entries for version from now on, and delete those of every
+        version but it and previous, whichever process wrote them"""
+        keep = {_dir_name(version), previous and _dir_name(previous)}
+        self.version_dir = os.path.join(self.directory, _dir_name(version))
+        os.makedirs(self.version_dir, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name in keep:
+                continue
+            path = os.path.join(self.directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        for _, key in self._entries():
+            self._remove(key)
+
+    def __len__(self):
+        return len(self._entries())
+
+
+def _dir_name(version):
+    return re.sub(r'[^\w.-]', '_', version)
+
+
+class ResultCache(object):
+    """Size-bounded cache of prepare_note results.
+
+    Keys are a hash of the loaded model version and the transcript text, and
+    the entries of older versions are dropped the first time a new model
+    version is seen, so results never outlive the model that produced them.
+    The previous version is remembered so jobs still finishing on the old
+    model during a hot swap don't flush the cache again. Hits, misses and
+    evictions are also counted on /metrics."""
+
+    def __init__(self, backend, max_entries=1024):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.version = None
+        self.previous_version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(version, text):
+        digest = hashlib.sha256(version.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(text.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _check_version(self, model):
+        version = model_version(model)
+        if version != self.version and version != self.previous_version:
+            self.previous_version = self.version
+            self.version = version
+            self.backend.use_version(version, self.previous_version)
+        return version
+
+    def get(self, model, text):
+        """Cached result for text, or None"""
+        with self._lock:
+            version = self._check_version(model)
+            value = self.backend.get(self.key(version, text))
+            if value is None:
+                self.misses += 1
+                metrics.CACHE_MISSES.inc()
+                return None
+            self.hits += 1
+            metrics.CACHE_HITS.inc()
+        return json.loads(value)
+
+    def set(self, model, text, result):
+        value = json.dumps(result)
+        with self._lock:
+            version = self._check_version(model)
+            self.backend.set(self.key(version, text), value)
+            evicted = self.backend.trim(self.max_entries)
+            self.evictions += evicted
+            metrics.CACHE_EVICTIONS.inc(evicted)
+
+    def clear(self):
+        with self._lock:
+            self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'size': len(self.backend),
+                    'max_entries': self.max_entries, 'version': self.version}
+
+
+def make_cache(config, instance_path):
+    """ResultCache configured by RESULT_CACHE ('memory', 'disk' or None)"""
+    kind = config.get('RESULT_CACHE')
+    if not kind:
+        return None
+    if kind == 'memory':
+        backend = MemoryBackend()
+    elif kind == 'disk':
+        backend = DiskBackend(config.get('RESULT_CACHE_DIR') or
+                              os.path.join(instance_path, 'cache'))
+    else:
+        raise ValueError("Unknown RESULT_CACHE backend: {}".format(kind))
+    return ResultCache(backend, config.get('RESULT_CACHE_SIZE', 1024))
@@ -0,0 +1,49 @@
+import re
+
+# Transcripts longer than this are extracted chunk by chunk; each chunk
+# stays far below spaCy's max_length and keeps a Doc's memory bounded.
+CHUNK_CHARS = 20000
+CHUNK_OVERLAP = 400
+
+SENTENCE_END = re.compile(r'[.!?]\s+|\n\s*')
+
+
+def iter_chunks(text, start=0, end=None, max_chars=CHUNK_CHARS,
+                overlap=CHUNK_OVERLAP):
+    """Split text[start:end] into chunks of at most max_chars, cut at a
+    sentence end where possible, with about `overlap` characters shared by
+    consecutive chunks.
+
+    Yields (start, end, own_start, own_end) character offsets into `text`.
+    A chunk owns the entities that start in [own_start, own_end); the seam
+    sits in the middle of the overlap, so an entity cut off at the edge of
+    one chunk is taken whole from its neighbour, and only once."""
+    end = len(text) if end is None else end
+    overlap = min(overlap, max_chars // 4)
+    pos = own_start = start
+    while end - pos > max_chars:
+        cut = _cut(text, pos + max_chars // 2, pos + max_chars)
+        next_pos = _word_start(text, max(cut - overlap, pos + 1), cut)
+        own_end = (next_pos + cut) // 2
+        yield pos, cut, own_start, own_end
+        pos, own_start = next_pos, own_end
+    yield pos, end, own_start, end
+
+
+def _cut(text, low, high):
+    """Last sentence end in text[low:high], else the last word break"""
+    cut = None
+    for match in SENTENCE_END.finditer(text, low, high):
+        cut = match.end()
+    if cut is not None:
+        return cut
+    space = max(text.rfind(' ', low, high), text.rfind('\n', low, high))
+    return space + 1 if space >= 0 else high
+
+
+def _word_start(text, low, high):
+    """First word start in text[low:high], so no token is split"""
+    pos = low
+    while pos < high and not text[pos - 1].isspace():
+        pos += 1
+    return pos
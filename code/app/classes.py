@@ -3,9 +3,16 @@ from werkzeug.security import check_password_hash
 from werkzeug.security import generate_password_hash
 from app import db, login_manager
 from flask_wtf.file import FileField, FileRequired
+from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
+import hashlib
 import pytz
 
+# JSON documents: JSONB on Postgres (indexable, queried server-side), the
+# JSON type elsewhere. Python None is stored as SQL NULL
+JSONDocument = db.JSON(none_as_null=True).with_variant(
+    JSONB(none_as_null=True), 'postgresql')
+
 
 class User(db.Model, UserMixin):
     """Schema for 'users' table in database.
@@ -47,6 +54,20 @@ class Verification(db.Model):
         return len(input) >= 8
 
 
+class SectionText(db.Model):
+    """Schema for 'section_texts' table in database.
+    Each distinct section text once, keyed by its SHA-256 so a section
+    reviewed with many entities is stored a single time."""
+    __tablename__ = "section_texts"
+    index = db.Column(db.Integer, primary_key=True)
+    hash = db.Column(db.String(64), unique=True, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+
+    @staticmethod
+    def digest(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
 class Data(db.Model):
     """Schema for 'transcriptions' table in database.
     Functions to add observations."""
@@ -55,15 +76,21 @@ class Data(db.Model):
     id = db.Column(db.Integer, nullable=False)
     mrn = db.Column(db.Integer, nullable=False)
     transcription_id = db.Column(db.String(80), nullable=False)
-    text = db.Column(db.Text, nullable=False)
+    # text per section lives in section_texts, shared by its entities
+    section_text_id = db.Column(
+        db.Integer, db.ForeignKey('section_texts.index',
+                                  name='fk_transcriptions_section_text_id'),
+        nullable=False, index=True)
+    section_text = db.relationship(SectionText)
     entity = db.Column(db.Text, nullable=True)
     start = db.Column(db.Integer, nullable=True)
     end = db.Column(db.Integer, nullable=True)
     label = db.Column(db.String(100), nullable=True)
     subject_id = db.Column(db.String(200), nullable=False)
-    timestamp = db.Column(db.DateTime)
+    # retrain.get_data selects the past week
+    timestamp = db.Column(db.DateTime, index=True)
 
-    def __init__(self, id, mrn, transcription_id, text, entity,
+    def __init__(self, id, mrn, transcription_id, section_text_id, entity,
                  start, end, label, subject_id, timestamp):
         """Notes:
          - physician_id should be automatically set after logging in, not input
@@ -74,7 +101,7 @@ class Data(db.Model):
         self.mrn = mrn
         self.transcription_id = transcription_id
         # text per section (i.e. diagnosis, RFV, prescription, etc)
-        self.text = text
+        self.section_text_id = section_text_id
         # text selected from model as medical entity from section text
         self.entity = entity
         self.start = start  # start index of entity in text
@@ -85,6 +112,10 @@ class Data(db.Model):
         self.subject_id = subject_id
         self.timestamp = timestamp
 
+    @property
+    def text(self):
+        return self.section_text.text
+
     def __repr__(self):
         info = (self.id, self.mrn, self.transcription_id, self.text,
                 self.entity, self.start, self.end, self.label,
@@ -103,13 +134,34 @@ class Queue(db.Model):
     """Schema for 'queue' table in database.
     Functions to add observations."""
     __tablename__ = "queue"
+    __table_args__ = (
+        # a physician's uploads, newest first (routes.queue)
+        db.Index('ix_queue_id_timestamp_index', 'id', 'timestamp', 'index'),
+        # claimable jobs, oldest first (app.jobs.claim)
+        db.Index('ix_queue_status_timestamp', 'status', 'timestamp'))
     index = db.Column(db.Integer, primary_key=True)
     id = db.Column(db.Integer, nullable=False)
     mrn = db.Column(db.Integer, nullable=False)
-    transcription_id = db.Column(db.String(80), nullable=False)
+    transcription_id = db.Column(db.String(80), nullable=False, index=True)
     timestamp = db.Column(db.DateTime)
     filename = db.Column(db.String(80), nullable=False)
-    content = db.Column(db.Text, nullable=True)
+    # extraction results; only loaded by with_payload() or on access
+    content = db.deferred(db.Column(JSONDocument, nullable=True),
+                          group='payload')
+    # job state, see app.jobs: pending -> claimed -> done (or failed)
+    status = db.Column(db.String(20), nullable=False, default='pending',
+                       server_default='pending')
+    worker = db.Column(db.String(200), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0,
+                         server_default='0')
+    # profile this upload's processing, see app.profiling
+    profile = db.Column(db.Boolean, nullable=False, default=False,
+                        server_default=db.false())
+
+    # what the upload status page shows
+    SUMMARY_COLUMNS = ('index', 'id', 'mrn', 'transcription_id',
+                       'timestamp', 'filename', 'status')
 
     def __init__(self, id, mrn, transcription_id, timestamp, filename):
         self.id = id
@@ -117,21 +169,56 @@ class Queue(db.Model):
         self.transcription_id = transcription_id
         self.timestamp = timestamp
         self.filename = filename
+        self.status = 'pending'
+        self.attempts = 0
+        self.profile = False
+
+    @classmethod
+    def summaries(cls):
+        """Query loading only SUMMARY_COLUMNS, for list pages"""
+        return cls.query.options(db.load_only(*cls.SUMMARY_COLUMNS))
+
+    @classmethod
+    def with_payload(cls):
+        """Query loading the deferred result columns up front"""
+        return cls.query.options(db.undefer_group('payload'))
 
 
 class History(db.Model):
     """Schema for 'queue' table in database.
     Functions to add observations."""
     __tablename__ = "history"
+    __table_args__ = (
+        # a physician's reports, newest first, and the MRN search
+        # (routes.history); index breaks timestamp ties for keyset paging
+        db.Index('ix_history_id_timestamp_index', 'id', 'timestamp',
+                 'index'),
+        db.Index('ix_history_id_mrn_timestamp_index', 'id', 'mrn',
+                 'timestamp', 'index'),
+        # containment queries on reviewed entities (having_entity)
+        db.Index('ix_history_diseases', 'diseases', postgresql_using='gin',
+                 postgresql_ops={'diseases': 'jsonb_path_ops'}),
+        db.Index('ix_history_meds', 'meds', postgresql_using='gin',
+                 postgresql_ops={'meds': 'jsonb_path_ops'}))
     index = db.Column(db.Integer, primary_key=True)
     id = db.Column(db.Integer, nullable=False)
     mrn = db.Column(db.Integer, nullable=False)
-    transcription_id = db.Column(db.String(80), nullable=False)
+    transcription_id = db.Column(db.String(80), nullable=False, index=True)
     timestamp = db.Column(db.DateTime)
     filename = db.Column(db.String(80), nullable=False)
-    content = db.Column(db.Text, nullable=False)
-    diseases = db.Column(db.Text, nullable=False)
-    meds = db.Column(db.Text, nullable=False)
+    # the reviewed report; only loaded by with_payload() or on access.
+    # content is the extraction result, diseases and meds map each section
+    # to the entities the physician kept
+    content = db.deferred(db.Column(JSONDocument, nullable=False),
+                          group='payload')
+    diseases = db.deferred(db.Column(JSONDocument, nullable=False),
+                           group='payload')
+    meds = db.deferred(db.Column(JSONDocument, nullable=False),
+                       group='payload')
+
+    # what the history page shows
+    SUMMARY_COLUMNS = ('index', 'id', 'mrn', 'transcription_id',
+                       'timestamp', 'filename')
 
     def __init__(self, id, mrn, transcription_id, timestamp, filename,
                  content, diseases, meds):
@@ -144,12 +231,51 @@ class History(db.Model):
         self.diseases = diseases
         self.meds = meds
 
+    @classmethod
+    def summaries(cls):
+        """Query loading only SUMMARY_COLUMNS, for list pages"""
+        return cls.query.options(db.load_only(*cls.SUMMARY_COLUMNS))
+
+    @classmethod
+    def with_payload(cls):
+        """Query loading the deferred report columns up front"""
+        return cls.query.options(db.undefer_group('payload'))
+
+    @classmethod
+    def report(cls, physician_id, transcription_id, sections):
+        """(content, diseases, meds) of one of the physician's reports, or
+        None. content holds only {'text': ...} of the given sections: the
+        texts are extracted by the database, so the entity lists are never
+        transferred"""
+        texts = [cls.content[(section, 'text')] for section in sections]
+        row = db.session.query(cls.diseases, cls.meds, *texts).filter(
+            cls.id == physician_id,
+            cls.transcription_id == transcription_id).first()
+        if row is None:
+            return None
+        content = {section: {'text': text}
+                   for section, text in zip(sections, row[2:])}
+        return content, row[0], row[1]
+
+    @classmethod
+    def having_entity(cls, column, section, entity):
+        """Query of reports whose reviewed `column` ('diseases' or 'meds')
+        lists entity under section. On Postgres this is a JSONB
+        containment test served by the GIN index"""
+        if column not in ('diseases', 'meds'):
+            raise ValueError("Unknown entity column: {}".format(column))
+        document = getattr(cls, column)
+        if db.engine.dialect.name == 'postgresql':
+            return cls.query.filter(document.op('@>')(
+                db.cast({section: [entity]}, JSONB)))
+        return cls.query.filter(db.text(
+            "EXISTS (SELECT 1 FROM json_each({}.{}, :path) "
+            "WHERE value = :entity)".format(cls.__tablename__, column)
+        ).bindparams(path='$."{}"'.format(section), entity=entity))
+
 
 @login_manager.user_loader
 def load_user(id):
     """Get the user with a given user id."""
     return User.query.get(id)
 
-
-db.create_all()
-db.session.commit()
@@ -0,0 +1,283 @@
+from app import application, db
+from app.classes import Queue
+from collections import defaultdict
+from datetime import datetime, timedelta
+import logging
+import os
+import select
+import socket
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+PENDING = 'pending'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+
+# Queue.timestamp holds wall time at UTC-7 (see routes.upload)
+TIMESTAMP_OFFSET = timedelta(hours=-7)
+
+# Postgres channel the upload route notifies so idle workers in other
+# processes wake up at once instead of on their next poll.
+CHANNEL = 'armr_jobs'
+
+_wakeup = threading.Condition()
+_generation = 0
+
+# claims this process holds, {index: worker}, refreshed by the heartbeat
+# thread while the uploads wait in the pipeline
+_held = {}
+_held_lock = threading.Lock()
+_heartbeat_pid = None
+
+
+def worker_name(suffix=''):
+    """Identifier stored on claimed rows, unique per host/process/thread"""
+    return "{}:{}:{}".format(socket.gethostname(), os.getpid(),
+                             suffix or threading.current_thread().name)
+
+
+def queued_at(upload):
+    """Epoch seconds at which a Queue row was uploaded"""
+    uploaded = upload.timestamp.replace(tzinfo=None) - TIMESTAMP_OFFSET
+    return (uploaded - datetime(1970, 1, 1)).total_seconds()
+
+
+def notify():
+    """Wake idle workers after an upload was queued: those in this process
+    directly, those in other processes through Postgres NOTIFY"""
+    global _generation
+    with _wakeup:
+        _generation += 1
+        _wakeup.notify_all()
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text("NOTIFY {}".format(CHANNEL)))
+        db.session.commit()
+
+
+def _wait(generation, timeout):
+    """Sleep until notify() runs after `generation` was read, or timeout"""
+    with _wakeup:
+        if _generation == generation:
+            _wakeup.wait(timeout)
+
+
+def _claimable(now):
+    """Pending uploads, plus claims abandoned by a crashed worker"""
+    stale = now - timedelta(
+        seconds=application.config.get('JOB_CLAIM_TIMEOUT', 600))
+    return db.or_(Queue.status == PENDING,
+                  db.and_(Queue.status == CLAIMED, Queue.claimed_at < stale))
+
+
+def claim(worker, limit=1):
+    """Atomically claim up to `limit` uploads for `worker`, oldest first.
+
+    On Postgres the rows are locked with SELECT ... FOR UPDATE SKIP LOCKED,
+    so concurrent workers never wait on or take each other's rows. Other
+    databases (SQLite in tests) use a conditional UPDATE per candidate row:
+    only the worker whose UPDATE still sees the row claimable gets it."""
+    now = datetime.utcnow()
+    if db.engine.dialect.name == 'postgresql':
+        uploads = Queue.query.filter(_claimable(now)).order_by(
+            Queue.timestamp.asc()).limit(limit).with_for_update(
+            skip_locked=True).all()
+        for upload in uploads:
+            upload.status = CLAIMED
+            upload.worker = worker
+            upload.claimed_at = now
+        db.session.commit()
+        _hold([upload.index for upload in uploads], worker)
+        return uploads
+
+    candidates = db.session.query(Queue.index).filter(
+        _claimable(now)).order_by(Queue.timestamp.asc()).limit(limit).all()
+    claimed = []
+    for (index,) in candidates:
+        updated = Queue.query.filter(
+            Queue.index == index, _claimable(now)).update(
+            {'status': CLAIMED, 'worker': worker, 'claimed_at': now},
+            synchronize_session=False)
+        db.session.commit()
+        if updated:
+            claimed.append(index)
+    if not claimed:
+        return []
+    _hold(claimed, worker)
+    return Queue.query.filter(Queue.index.in_(claimed)).order_by(
+        Queue.timestamp.asc()).all()
+
+
+def _hold(indexes, worker):
+    global _heartbeat_pid
+    with _held_lock:
+        for index in indexes:
+            _held[index] = worker
+        if _heartbeat_pid != os.getpid():
+            _heartbeat_pid = os.getpid()
+            timeout = application.config.get('JOB_CLAIM_TIMEOUT', 600)
+            threading.Thread(target=_beat, args=(timeout / 4.0,),
+                             name='job-heartbeat', daemon=True).start()
+
+
+def forget(indexes):
+    """Stop refreshing claims that were finished or released"""
+    with _held_lock:
+        for index in indexes:
+            _held.pop(index, None)
+
+
+def heartbeat():
+    """Refresh claimed_at of the claims this process still holds, so
+    uploads queued in the pipeline for longer than JOB_CLAIM_TIMEOUT are
+    not taken over as abandoned. Returns how many were refreshed"""
+    with _held_lock:
+        held = dict(_held)
+    claims = defaultdict(list)
+    for index, worker in held.items():
+        claims[worker].append(index)
+    now = datetime.utcnow()
+    refreshed = 0
+    for worker, indexes in claims.items():
+        refreshed += Queue.query.filter(
+            Queue.index.in_(indexes), held_by(worker)).update(
+            {'claimed_at': now}, synchronize_session=False)
+    db.session.commit()
+    return refreshed
+
+
+def _beat(interval):
+    while True:
+        time.sleep(interval)
+        with application.app_context():
+            try:
+                heartbeat()
+            except Exception:
+                log.exception("Refreshing job claims failed")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+
+def held_by(worker):
+    """Filter for uploads `worker` still holds: claimed by it and not
+    taken over since. Every write that ends a claim goes through it"""
+    return db.and_(Queue.worker == worker, Queue.status == CLAIMED)
+
+
+def run(handler, uploads, worker):
+    """Call handler on uploads claimed by worker. On error the uploads go
+    back to pending, or to failed after JOB_MAX_ATTEMPTS tries"""
+    indexes = [upload.index for upload in uploads]
+    try:
+        handler(uploads)
+    except Exception:
+        log.exception("Processing uploads %s failed", indexes)
+        db.session.rollback()
+        release(indexes, worker)
+
+
+def release(indexes, worker):
+    """Give uploads whose processing failed back to the queue, or mark them
+    failed after JOB_MAX_ATTEMPTS tries. Uploads worker no longer holds,
+    e.g. taken over and finished by another worker, are left alone.
+    Returns how many were released"""
+    max_attempts = application.config.get('JOB_MAX_ATTEMPTS', 3)
+    attempts = db.func.coalesce(Queue.attempts, 0) + 1
+    released = Queue.query.filter(
+        Queue.index.in_(indexes), held_by(worker)).update(
+        {'attempts': attempts,
+         'status': db.case([(attempts >= max_attempts, FAILED)],
+                           else_=PENDING),
+         'worker': None}, synchronize_session=False)
+    db.session.commit()
+    forget(indexes)
+    if released < len(indexes):
+        log.warning("%d of uploads %s were taken over before their release",
+                    len(indexes) - released, indexes)
+    return released
+
+
+def finish(index, worker, values):
+    """Store values (e.g. content) on an upload and mark it done, if
+    worker still holds it; False when it was taken over, in which case
+    the caller discards its result. The caller commits"""
+    return Queue.query.filter(Queue.index == index, held_by(worker)).update(
+        dict(values, status=DONE), synchronize_session=False) > 0
+
+
+def process_next(handler, worker, limit):
+    """Claim and handle the next batch; False when nothing was pending"""
+    uploads = claim(worker, limit)
+    if not uploads:
+        return False
+    run(handler, uploads, worker)
+    return True
+
+
+class JobWorker(threading.Thread):
+    """Thread that claims uploads in batches and hands them to `handler`,
+    sleeping until notify() (or poll_interval) when the queue is empty"""
+
+    def __init__(self, handler, batch_size=8, poll_interval=10, name=None):
+        super(JobWorker, self).__init__(name=name, daemon=True)
+        self.handler = handler
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        worker = worker_name(self.name)
+        while not self.stopped.is_set():
+            generation = _generation
+            with application.app_context():
+                try:
+                    busy = process_next(self.handler, worker,
+                                        self.batch_size)
+                except Exception:
+                    log.exception("Job worker %s failed to claim", worker)
+                    busy = False
+                finally:
+                    db.session.remove()
+            if not busy:
+                _wait(generation, self.poll_interval)
+
+    def stop(self):
+        self.stopped.set()
+        with _wakeup:
+            _wakeup.notify_all()
+
+
+def _listen(poll_interval):
+    """Forward Postgres NOTIFYs on CHANNEL to the workers of this process"""
+    global _generation
+    with application.app_context():
+        connection = db.engine.raw_connection()
+    connection.connection.set_isolation_level(0)  # autocommit
+    cursor = connection.cursor()
+    cursor.execute("LISTEN {}".format(CHANNEL))
+    while True:
+        if select.select([connection.connection], [], [], poll_interval)[0]:
+            connection.connection.poll()
+            del connection.connection.notifies[:]
+            with _wakeup:
+                _generation += 1
+                _wakeup.notify_all()
+
+
+def start_workers(handler, count=None):
+    """Start `count` (default JOB_WORKERS) worker threads for handler"""
+    config = application.config
+    count = config.get('JOB_WORKERS', 1) if count is None else count
+    poll_interval = config.get('JOB_POLL_SECONDS', 10)
+    workers = [JobWorker(handler, config.get('JOB_BATCH_SIZE', 8),
+                         poll_interval, name='job-worker-{}'.format(i))
+               for i in range(count)]
+    for worker in workers:
+        worker.start()
+    if workers and db.engine.dialect.name == 'postgresql':
+        threading.Thread(target=_listen, args=(poll_interval,),
+                         name='job-listener', daemon=True).start()
+    return workers
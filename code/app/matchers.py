@@ -0,0 +1,81 @@
+from spacy.matcher import Matcher
+import threading
+
+TERMINOLOGY = [
+    "history of present illness", "past medical and surgical history",
+    "past medical history", "review of systems", "family history",
+    "social history", "medications prior to admission",
+    "allergies", "physical examination", "electrocardiogram", "impression",
+    "recommendations"]
+
+
+def model_version(model):
+    """Name and version from the model meta, e.g. 'en_ner_bc5cdr_md-0.2.0'"""
+    meta = getattr(model, 'meta', None) or {}
+    return "{}-{}".format(meta.get('name', 'model'), meta.get('version', '0'))
+
+
+def build_medication_matcher(model):
+    """Token Matcher for drug, drug/amount/unit and drug/amount/unit/method"""
+    matcher = Matcher(model.vocab)
+
+    has_method_pattern = [
+        {"ENT_TYPE": "CHEMICAL"},
+        {"LIKE_NUM": True},
+        {"LOWER": "mg"}, {}]
+    matcher.add("HasMethod", None, has_method_pattern)
+
+    no_method_pattern = [
+        {"ENT_TYPE": "CHEMICAL"},
+        {"LIKE_NUM": True},
+        {"LOWER": "mg"}]
+    matcher.add("NoMethod", None, no_method_pattern)
+
+    just_drug_pattern = [{"ENT_TYPE": "CHEMICAL"}]
+    matcher.add("JustDrug", None, just_drug_pattern)
+    return matcher
+
+
+class MatcherRegistry(object):
+    """Compiled matchers shared across calls.
+
+    Matchers are built once per loaded model (its vocab) and keyed by the
+    model version, so they are only rebuilt when a new model is loaded, e.g.
+    after retrain.py produces a new version. The last `keep` models are
+    retained so an old and a new model can both be served during a swap."""
+
+    builders = {'medications': build_medication_matcher}
+
+    def __init__(self, keep=2):
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._entries = []  # [(key, vocab, {name: matcher})], newest last
+
+    def get(self, model, name):
+        """Return the compiled matcher `name` for this model"""
+        key = (model_version(model), id(model.vocab))
+        with self._lock:
+            for entry in self._entries:
+                if entry[0] == key and entry[1] is model.vocab:
+                    matchers = entry[2]
+                    break
+            else:
+                # holding the vocab keeps id(vocab) from being reused
+                matchers = {}
+                self._entries.append((key, model.vocab, matchers))
+                del self._entries[:-self.keep]
+            if name not in matchers:
+                matchers[name] = self.builders[name](model)
+            return matchers[name]
+
+    def versions(self):
+        """Model versions that currently have compiled matchers"""
+        with self._lock:
+            return [entry[0][0] for entry in self._entries]
+
+    def clear(self):
+        with self._lock:
+            self._entries = []
+
+
+registry = MatcherRegistry()
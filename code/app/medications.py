@@ -0,0 +1,32 @@
+from spacy.attrs import ENT_TYPE, LIKE_NUM, LOWER
+import numpy
+
+
+def medication_bounds(doc):
+    """Token bounds (start, end) of the medication mentions in a Doc.
+
+    Vectorised equivalent of the HasMethod/NoMethod/JustDrug Matcher plus
+    medication_spans: every CHEMICAL token starts a mention, which grows to
+    drug/amount/'mg' when followed by a number and 'mg', and takes one more
+    token as the method when there is one. Keeping only the longest mention
+    per start token is what the last_start logic does with Matcher output."""
+    n = len(doc)
+    if not n:
+        return []
+    strings = doc.vocab.strings
+    array = doc.to_array([ENT_TYPE, LIKE_NUM, LOWER])
+    chemical = array[:, 0] == numpy.uint64(strings['CHEMICAL'])
+    starts = numpy.flatnonzero(chemical)
+    if not len(starts):
+        return []
+    like_num = array[:, 1] != 0
+    mg = array[:, 2] == numpy.uint64(strings['mg'])
+
+    dosed = numpy.zeros(n, dtype=bool)
+    if n > 2:
+        dosed[:-2] = like_num[1:-1] & mg[2:]
+    dosed = dosed[starts]
+    lengths = numpy.ones(len(starts), dtype=numpy.int64)
+    lengths[dosed] = 3
+    lengths[dosed & (starts + 3 < n)] = 4
+    return list(zip(starts.tolist(), (starts + lengths).tolist()))
@@ -0,0 +1,124 @@
+from app.pipeline import report
+from contextlib import contextmanager
+from prometheus_client import (CollectorRegistry, Counter, Histogram, REGISTRY,
+                               CONTENT_TYPE_LATEST, generate_latest)
+from prometheus_client.core import GaugeMetricFamily
+import os
+import threading
+import time
+
+# Stages between routes.upload and a populated Queue.content, plus the
+# results page render.
+STAGES = ('upload_save', 'queue_wait', 'asr', 'categorize_note',
+          'parse_entities', 'db_commit', 'results_render')
+
+# From 5 ms (a section parse) to 30 min (a backlogged queue wait)
+BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120,
+           300, 600, 1800, float('inf'))
+
+STAGE_SECONDS = Histogram('armr_stage_seconds',
+                          'Time spent in each processing stage',
+                          ['stage'], buckets=BUCKETS)
+STAGE_ERRORS = Counter('armr_stage_errors_total',
+                       'Stage calls that raised', ['stage'])
+UPLOADS = Counter('armr_uploads_total', 'Recordings uploaded')
+JOBS = Counter('armr_jobs_total', 'Uploads that finished processing',
+               ['status'])
+CACHE_HITS = Counter('armr_result_cache_hits_total',
+                     'prepare_note results served from the result cache')
+CACHE_MISSES = Counter('armr_result_cache_misses_total',
+                       'Result cache lookups that found nothing')
+CACHE_EVICTIONS = Counter('armr_result_cache_evictions_total',
+                          'Result cache entries dropped by the size bound')
+
+# label lookups resolved once, so observing is a lock and two additions
+_seconds = {stage: STAGE_SECONDS.labels(stage) for stage in STAGES}
+_errors = {stage: STAGE_ERRORS.labels(stage) for stage in STAGES}
+
+_local = threading.local()
+
+
+def _record(stage, seconds, failed=False):
+    observations = getattr(_local, 'observations', None)
+    if observations is not None:
+        observations.append((stage, seconds, failed))
+        return
+    if failed:
+        _errors[stage].inc()
+    _seconds[stage].observe(seconds)
+
+
+def observe(stage, seconds):
+    _record(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    """Record the duration of the block in the stage's histogram, and
+    count it as an error if it raises"""
+    begin = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        _record(stage, time.perf_counter() - begin, failed)
+
+
+@contextmanager
+def collected():
+    """Collect the observations made in this thread in a list instead of
+    recording them. Forked NLP processes return the list with their
+    results and the parent replays it, so the timings reach /metrics
+    without prometheus_multiproc_dir"""
+    _local.observations = observations = []
+    try:
+        yield observations
+    finally:
+        _local.observations = None
+
+
+def replay(observations):
+    """Record observations collected by collected(), e.g. in a child"""
+    for stage, seconds, failed in observations:
+        if failed:
+            _errors[stage].inc()
+        _seconds[stage].observe(seconds)
+
+
+class PipelineCollector(object):
+    """Queue depth of every running pipeline stage, read at scrape time"""
+
+    def collect(self):
+        depth = GaugeMetricFamily('armr_pipeline_queue_depth',
+                                  'Items waiting in front of a stage',
+                                  labels=['pipeline', 'stage'])
+        for name, stats in report().items():
+            for stage, values in stats.items():
+                if isinstance(values, dict):
+                    depth.add_metric([name, stage], values['queue_depth'])
+        yield depth
+
+
+REGISTRY.register(PipelineCollector())
+
+
+def exposition():
+    """(body, content type) of the metrics in Prometheus text format.
+
+    With the prometheus_multiproc_dir environment variable set, every
+    gunicorn worker writes its values there and they are merged here;
+    otherwise only this process's values are reported. Timings of the
+    forked NLP processes are recorded by the process that forked them
+    (see collected())"""
+    if 'prometheus_multiproc_dir' in os.environ:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(PipelineCollector())
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,111 @@
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Short dictation run through a freshly loaded model before it goes live,
+# so the first real note doesn't pay for lazy initialisation.
+WARMUP_NOTES = [
+    "History of present illness: 64 year old man with hypertension and "
+    "atrial fibrillation presenting with chest pain. Past medical history: "
+    "diabetes mellitus. Medications prior to admission: aspirin 81 mg daily, "
+    "metoprolol 25 mg orally. Allergies: penicillin. Impression: stable "
+    "angina. Recommendations: continue aspirin."]
+
+
+def version_key(name):
+    """Sort key for model directory names such as 'en_ner_bc5cdr_md-0.12.0'
+    or '0.12.0': the version after the last '-'. None for anything else,
+    including the '.tmp' directories retrain writes a model to first"""
+    if name.endswith('.tmp'):
+        return None
+    try:
+        return tuple(int(part) for part in name.rsplit('-', 1)[-1].split('.'))
+    except ValueError:
+        return None
+
+
+class ModelRegistry(object):
+    """Versioned holder of the spaCy model served by the app.
+
+    A new version is loaded and warmed up in the background, then swapped in
+    with a single assignment. Callers take `current()` once per request or
+    job and keep that reference, so work already in flight finishes on the
+    model it started with while new work picks up the new version."""
+
+    def __init__(self, models_dir, warmup_notes=WARMUP_NOTES):
+        self.models_dir = models_dir
+        self.warmup_notes = warmup_notes
+        self.model = None
+        self.model_dir = None
+        self.loaded_at = None
+        self.history = []  # [(model_dir, loaded_at, load seconds)]
+        self._lock = threading.Lock()
+        self._first_load = threading.Lock()
+        self._loading = None
+
+    def current(self):
+        """The live model, loading the newest version on first use; keep
+        the returned reference for the whole job"""
+        if self.model is None:
+            with self._first_load:
+                if self.model is None:
+                    self.load(self.latest_dir())
+        return self.model
+
+    def latest_dir(self):
+        """Directory of the newest model version under models_dir"""
+        versions = []
+        for name in os.listdir(self.models_dir):
+            key = version_key(name)
+            if key is not None and \
+                    os.path.isdir(os.path.join(self.models_dir, name)):
+                versions.append((key, name))
+        if not versions:
+            raise IOError("No model found in {}".format(self.models_dir))
+        return os.path.join(self.models_dir, max(versions)[1])
+
+    def load(self, model_dir):
+        """Load and warm up the model in model_dir, then make it live"""
+        import spacy
+        from app.nlp import prepare_notes
+
+        begin = time.perf_counter()
+        model = spacy.load(model_dir)
+        prepare_notes(model, self.warmup_notes)
+        seconds = time.perf_counter() - begin
+        with self._lock:
+            self.model = model
+            self.model_dir = model_dir
+            self.loaded_at = time.time()
+            self.history.append((model_dir, self.loaded_at, seconds))
+        log.info("Model %s live after %.1fs", model_dir, seconds)
+        return model
+
+    def load_async(self, model_dir):
+        """Load model_dir on a background thread; returns the thread, or
+        None when a load is already running"""
+        with self._lock:
+            if self._loading is not None and self._loading.is_alive():
+                return None
+            self._loading = threading.Thread(
+                target=self._load_logged, args=(model_dir,),
+                name='model-load', daemon=True)
+            self._loading.start()
+            return self._loading
+
+    def _load_logged(self, model_dir):
+        try:
+            self.load(model_dir)
+        except Exception:
+            log.exception("Loading model %s failed, keeping %s",
+                          model_dir, self.model_dir)
+
+    def refresh(self):
+        """Start loading the newest model version if it isn't live yet"""
+        latest = self.latest_dir()
+        if latest != self.model_dir:
+            return self.load_async(latest)
+        return None
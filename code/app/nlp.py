@@ -1,21 +1,42 @@
-from app import application, db, scheduler, spacy_model
+from app import application, db, scheduler, model_registry
 from app.classes import User, Data, Queue
-import json
+from app.matchers import TERMINOLOGY, registry
+from app.segment import split_sections
+from app.cache import make_cache
+from app.asr import make_backend
+from app import audio, jobs, metrics, profiling
+from app.medications import medication_bounds
+from app.chunking import CHUNK_CHARS, CHUNK_OVERLAP, iter_chunks
+from app.pipeline import Pipeline, Stage
+from collections import Counter, defaultdict, deque, namedtuple
+from contextlib import contextmanager
+import copy
+import functools
 from pathlib import Path
 import os
 import random
 import spacy
-from spacy.matcher import Matcher, PhraseMatcher
 from spacy.util import minibatch, compounding
 import shutil
-import speech_recognition as sr
+import logging
+import multiprocessing
+import threading
+import time
 
-TERMINOLOGY = [
-    "history of present illness", "past medical and surgical history",
-    "past medical history", "review of systems", "family history",
-    "social history", "medications prior to admission",
-    "allergies", "physical examination", "electrocardiogram", "impression",
-    "recommendations"]
+log = logging.getLogger(__name__)
+
+# Components each stage needs; None runs the whole pipeline. Segmenting
+# doesn't run the model (app.segment), and medications are read from
+# ENT_TYPE plus lexical attributes (LIKE_NUM, LOWER), so NER is enough.
+PIPELINE_PROFILES = {
+    'extract': ('ner',),
+    'full': None}
+
+
+# optional prepare_note result cache, see Config.RESULT_CACHE
+result_cache = make_cache(application.config, application.instance_path)
+# speech-to-text engine, see Config.ASR_BACKEND
+asr_backend = make_backend(application.config)
 
 
 def load_model(model_dir):
@@ -23,9 +44,76 @@ def load_model(model_dir):
     return spacy.load(model_dir)
 
 
-def prepare_note(model, text):
+def run_profile(model, text, profile='full'):
+    """Tokenize text and apply only the components of a pipeline profile.
+    Unlike nlp.disable_pipes this leaves the shared model untouched, so it
+    is safe to call from several threads"""
+    keep = PIPELINE_PROFILES[profile]
+    run = profiling.current()
+    if run is not None:
+        return _run_profile_timed(model, text, keep, run)
+    doc = model.make_doc(text)
+    for name, component in model.pipeline:
+        if keep is None or name in keep:
+            doc = component(doc)
+    return doc
+
+
+def _run_profile_timed(model, text, keep, run):
+    with run.timed('tokenizer'):
+        doc = model.make_doc(text)
+    for name, component in model.pipeline:
+        if keep is None or name in keep:
+            with run.timed(name):
+                doc = component(doc)
+    return doc
+
+
+def pipe_profile(model, texts, profile='full', batch_size=32):
+    """Stream texts through the components of a profile with each
+    component's batched pipe(); yields Docs in input order"""
+    keep = PIPELINE_PROFILES[profile]
+    run = profiling.current()
+    docs = (model.make_doc(text) for text in texts)
+    upstream = 'tokenizer'
+    if run is not None:
+        docs = run.stream(upstream, docs)
+    for name, component in model.pipeline:
+        if keep is None or name in keep:
+            if hasattr(component, 'pipe'):
+                docs = component.pipe(docs, batch_size=batch_size)
+            else:
+                docs = map(component, docs)
+            if run is not None:
+                docs = run.stream(name, docs, upstream)
+                upstream = name
+    return docs
+
+
+def profile_report(model, texts, profiles=('extract',)):
+    """Average seconds per note with the full pipeline and with each
+    profile, and the time each profile saves per note"""
+    def per_note(profile):
+        begin = time.perf_counter()
+        for text in texts:
+            run_profile(model, text, profile)
+        return (time.perf_counter() - begin) / max(len(texts), 1)
+
+    full = per_note('full')
+    report = {}
+    for profile in profiles:
+        seconds = per_note(profile)
+        report[profile] = {'full': full, 'profile': seconds,
+                           'saved': full - seconds,
+                           'components': PIPELINE_PROFILES[profile]}
+    return report
+
+
+def prepare_note(model, text, single_pass=True):
     """Output of spaCy text processing containing categories, text, diseases,
         and medications"""
+    if single_pass:
+        return analyze_note(model, text)
     note_sections = categorize_note(model, text)
     for section in note_sections:
         diseases, medications = parse_entities(model, note_sections[section][
@@ -35,87 +123,240 @@ def prepare_note(model, text):
     return note_sections
 
 
-def categorize_note(model, text):
-    """Breakup notes into different sections"""
-    categories = {"history of present illness": {"text": "None"},
-                  "past medical and surgical history": {"text": "None"},
-                  "past medical history": {"text": "None"},
-                  "review of systems": {"text": "None"},
-                  "family history": {"text": "None"},
-                  "social history": {"text": "None"},
-                  "medications prior to admission": {"text": "None"},
-                  "allergies": {"text": "None"},
-                  "physical examination": {"text": "None"},
-                  "electrocardiogram": {"text": "None"},
-                  "impression": {"text": "None"},
-                  "recommendations": {"text": "None"}}
-    matcher = PhraseMatcher(model.vocab)
-    patterns = [model.make_doc(text) for text in TERMINOLOGY]
-    matcher.add("Categories", None, *patterns)
-    doc_lower = model(text.lower())
-    doc = model(text)
-    matches = matcher(doc_lower)
-    results = []
-    for match_id, start, end in matches:
-        span = doc_lower[start:end]
-        results.append((span, start, end))
-    results = sorted(results, key=lambda tup: tup[1])
-    for i in range(len(results)):
-        result = results[i]
-        next_result = results[i + 1] if i < len(results) - 1 else None
-        category = str(result[0])
-        start = result[2] if i != 0 else result[2]
-        end = next_result[1] if next_result else None
-        if end:
-            categories[category] = {'text': doc[start:end].text}
+def analyze_note(model, text):
+    """Find the sections with the header index, then run the model only over
+    the text of those sections"""
+    return analyze_notes(model, [text])[0]
+
+
+def analyze_notes(model, texts, batch_size=32):
+    """Results of analyze_note for each transcript, in order. The section
+    texts of every note are parsed in one batched stream; very long
+    transcripts go through prepare_long_note instead"""
+    results = [None] * len(texts)
+    short = []
+    for i, text in enumerate(texts):
+        if len(text) > CHUNK_CHARS:
+            with metrics.timed('parse_entities'):
+                results[i] = prepare_long_note(model, text)
+        else:
+            short.append(i)
+
+    notes = []
+    for i in short:
+        with metrics.timed('categorize_note'):
+            notes.append(note_sections(texts[i]))
+    docs = pipe_profile(model, (section for note in notes
+                                for section in note.values()),
+                        'extract', batch_size)
+    for i, note in zip(short, notes):
+        result = empty_note()
+        # batches are parsed as the first note of each is reached
+        with metrics.timed('parse_entities'):
+            for category, text in note.items():
+                diseases, medications = section_entities(model, next(docs))
+                result[category] = {'text': text, 'diseases': diseases,
+                                    'medications': medications}
+        results[i] = result
+    return results
+
+
+def empty_note():
+    """prepare_note result for a transcript without any sections"""
+    return {category: {'text': "None", 'diseases': [], 'medications': []}
+            for category in TERMINOLOGY}
+
+
+def prepare_long_note(model, text, max_chars=CHUNK_CHARS,
+                      overlap=CHUNK_OVERLAP):
+    """prepare_note for transcripts of any length: sections are extracted
+    in overlapping chunks, so only one bounded Doc is alive at a time"""
+    sections = split_sections(text)
+    # a repeated header overwrites the earlier section, as in note_sections
+    kept = {category: i for i, (category, _, _) in enumerate(sections)}
+    result = empty_note()
+    for category, i in kept.items():
+        _, start, end = sections[i]
+        result[category] = {'text': text[start:end], 'diseases': [],
+                            'medications': []}
+    for section, category, kind, _, _, record in stream_entities(
+            model, text, max_chars, overlap, sections=sections):
+        if kept[category] == section:
+            result[category][kind].append(record)
+    return result
+
+
+def stream_entities(model, text, max_chars=CHUNK_CHARS,
+                    overlap=CHUNK_OVERLAP, batch_size=4, sections=None):
+    """Extract entities chunk by chunk from a transcript of any length.
+
+    Chunks never cross a section and overlap their neighbours, and each
+    entity is reported once, by the chunk that owns its start. Yields
+    (section index, category, 'diseases' or 'medications', start, end,
+    record) with start/end as character offsets into `text`"""
+    if sections is None:
+        sections = split_sections(text)
+    pending = deque()
+
+    def chunk_texts():
+        for section, (category, start, end) in enumerate(sections):
+            for chunk in iter_chunks(text, start, end, max_chars, overlap):
+                pending.append((section, category) + chunk)
+                yield text[chunk[0]:chunk[1]]
+
+    for doc in pipe_profile(model, chunk_texts(), 'extract', batch_size):
+        section, category, offset, _, own_start, own_end = pending.popleft()
+        for entity in doc.ents:
+            start = offset + entity.start_char
+            if entity.label_ == 'DISEASE' and own_start <= start < own_end:
+                yield (section, category, 'diseases', start,
+                       offset + entity.end_char, {'name': str(entity)})
+        for bounds in medication_bounds(doc):
+            span = doc[bounds[0]:bounds[1]]
+            start = offset + span.start_char
+            medication = parse_medication(span)
+            if '.' not in medication['name'] and \
+                    own_start <= start < own_end:
+                yield (section, category, 'medications', start,
+                       offset + span.end_char, medication)
+
+
+def note_sections(text):
+    """Section texts of a transcript keyed by category, found without the
+    model; a repeated header overwrites the earlier section"""
+    sections = {}
+    for category, start, end in split_sections(text):
+        sections[category] = text[start:end]
+    return sections
+
+
+# model shared with forked batch workers; set before the pool is created
+_batch_model = None
+
+
+def _prepare_batch(texts):
+    """Worker side of prepare_notes: the results, and the stage timings
+    observed meanwhile for the calling process to record"""
+    with metrics.collected() as observations:
+        results = analyze_notes(_batch_model, texts, len(texts))
+    return results, observations
+
+
+def _join_batches(batches):
+    notes = []
+    for results, observations in batches:
+        metrics.replay(observations)
+        notes.extend(results)
+    return notes
+
+
+def prepare_notes(model, texts, batch_size=32, n_process=1, cache=None,
+                  pool=None):
+    """Batch version of prepare_note: returns one result per transcript, in
+    order. With n_process > 1 the batches are spread over forked worker
+    processes, which share the already loaded model copy-on-write; `pool`
+    reuses running ones (see NoteProcesses). Only transcripts missing from
+    `cache` (a ResultCache) are processed"""
+    texts = list(texts)
+    if cache is None:
+        return _prepare_notes(model, texts, batch_size, n_process, pool)
+    found = {}
+    for text in texts:
+        if text not in found:
+            found[text] = cache.get(model, text)
+    missing = [text for text, result in found.items() if result is None]
+    prepared = _prepare_notes(model, missing, batch_size, n_process, pool)
+    for text, result in zip(missing, prepared):
+        cache.set(model, text, result)
+        found[text] = result
+    return [copy.deepcopy(found[text]) for text in texts]
+
+
+def _prepare_notes(model, texts, batch_size, n_process, pool=None):
+    global _batch_model
+    if not texts:
+        return []
+    if pool is not None:
+        batches = [texts[i:i + batch_size]
+                   for i in range(0, len(texts), batch_size)]
+        return _join_batches(
+            pool.map(_prepare_batch, batches, chunksize=1))
+    if n_process > 1:
+        # small backlogs still get spread over every process
+        batch_size = max(1, min(batch_size, -(-len(texts) // n_process)))
+    batches = [texts[i:i + batch_size]
+               for i in range(0, len(texts), batch_size)]
+    _batch_model = model
+    try:
+        if n_process > 1 and len(batches) > 1:
+            context = multiprocessing.get_context('fork')
+            with context.Pool(min(n_process, len(batches))) as pool:
+                results = pool.map(_prepare_batch, batches, chunksize=1)
         else:
-            categories[category] = {'text': doc[start:].text}
+            results = [_prepare_batch(batch) for batch in batches]
+    finally:
+        _batch_model = None
+    return _join_batches(results)
+
+
+def categorize_note(model, text):
+    """Breakup notes into different sections. Headers are found with the
+    prebuilt header index, so the model is not run"""
+    with metrics.timed('categorize_note'):
+        categories = {category: {"text": "None"}
+                      for category in TERMINOLOGY}
+        for category, section in note_sections(text).items():
+            categories[category] = {'text': section}
     return categories
 
 
 def parse_entities(model, text):
     """model identifies clinical text from transcribed text"""
-    diseases = []
-    medications = []
-    matcher = Matcher(model.vocab)
-
-    has_method_pattern = [
-        {"ENT_TYPE": "CHEMICAL"},
-        {"LIKE_NUM": True},
-        {"LOWER": "mg"}, {}]
-    matcher.add("HasMethod", None, has_method_pattern)
+    with metrics.timed('parse_entities'):
+        doc = run_profile(model, text, 'extract')
+        return section_entities(model, doc, vectorised=False)
 
-    no_method_pattern = [
-        {"ENT_TYPE": "CHEMICAL"},
-        {"LIKE_NUM": True},
-        {"LOWER": "mg"}]
-    matcher.add("NoMethod", None, no_method_pattern)
 
-    just_drug_pattern = [{"ENT_TYPE": "CHEMICAL"}]
-    matcher.add("JustDrug", None, just_drug_pattern)
-
-    for entity in model(text).ents:
+def section_entities(model, doc, vectorised=True):
+    """Diseases and medications in one parsed section. Medications are
+    found from token attribute arrays, or with the Matcher when
+    vectorised is False"""
+    diseases = []
+    for entity in doc.ents:
         if entity.label_ == 'DISEASE':
             diseases.append({'name': str(entity)})
 
-    doc = model(text)
-    matches = matcher(doc)
-    if matches:
-        last_start = None
-        last_end = None
-        for match_id, start, end in matches:
-            string_id = model.vocab.strings[match_id]
-            span = doc[start:end]
-            if start != last_start and last_start is not None:
-                medication = parse_medication(doc[last_start:last_end])
-                if '.' not in medication['name']:
-                    medications.append(medication)
-            last_start = start
-            last_end = end
-        medication = parse_medication(doc[start:end])
+    if vectorised:
+        spans = [doc[start:end] for start, end in medication_bounds(doc)]
+    else:
+        matcher = registry.get(model, 'medications')
+        spans = medication_spans(doc, matcher(doc))
+    return diseases, collect_medications(spans)
+
+
+def collect_medications(spans):
+    """Parse the medication spans, skipping names with a '.' in them"""
+    medications = []
+    for span in spans:
+        medication = parse_medication(span)
         if '.' not in medication['name']:
-            medications.append(parse_medication(doc[start:end]))
-    return diseases, medications
+            medications.append(medication)
+    return medications
+
+
+def medication_spans(doc, matches):
+    """The last (longest) match found at each start token"""
+    spans = []
+    last_start = None
+    last_end = None
+    for match_id, start, end in matches:
+        if start != last_start and last_start is not None:
+            spans.append(doc[last_start:last_end])
+        last_start = start
+        last_end = end
+    if last_start is not None:
+        spans.append(doc[last_start:last_end])
+    return spans
 
 
 def parse_medication(span):
@@ -181,12 +422,21 @@ def train(model, train_data, output_dir, n_iter=100):
     full_path = output_dir[:97]
     new_version = "0." + str(int(current_version) + 1) + ".0"
     full_path += new_version
+    # stamp the version so matchers compiled for the old model are rebuilt
+    nlp.meta['version'] = new_version
 
     if full_path is not None:
         full_path = Path(full_path)
-        if not full_path.exists():
-            full_path.mkdir()
-        nlp.to_disk(full_path)
+        # save next to the final directory and rename it into place, so a
+        # running app never picks up a half-written model
+        staging = Path(str(full_path) + ".tmp")
+        if staging.exists():
+            shutil.rmtree(staging)
+        staging.mkdir()
+        nlp.to_disk(staging)
+        if full_path.exists():
+            shutil.rmtree(full_path)
+        staging.rename(full_path)
         print("Saved model to ", full_path)
 
     shutil.rmtree(output_dir)
@@ -196,26 +446,284 @@ def train(model, train_data, output_dir, n_iter=100):
 
 
 def transcribe(filepath):
-    r = sr.Recognizer()
-    recording = sr.AudioFile(filepath)
-    with recording as source:
-        audio = r.record(source)
-    talk_to_text = r.recognize_google(audio)
-    return talk_to_text
+    """Speech to text with the ASR backend chosen by Config.ASR_BACKEND.
+    With AUDIO_PREPROCESS the audio is downmixed, resampled and has its
+    silences compressed first. Recordings longer than ASR_SEGMENT_SECONDS
+    are streamed in segments that are transcribed concurrently"""
+    config = application.config
+    seconds = config.get('ASR_SEGMENT_SECONDS')
+    if seconds and audio.duration(filepath) <= seconds:
+        seconds = None
+    preprocessor = None
+    if config.get('AUDIO_PREPROCESS'):
+        preprocessor = audio.Preprocessor(
+            rate=config.get('ASR_SAMPLE_RATE', 16000),
+            silence_db=config.get('AUDIO_SILENCE_DB', -40.0),
+            max_silence=config.get('AUDIO_MAX_SILENCE', 0.3))
+    elif not seconds:
+        return asr_backend.transcribe(filepath)
 
+    text = asr_backend.transcribe_segments(
+        audio.iter_segments(filepath, seconds, preprocess=preprocessor),
+        source=filepath)
+    if preprocessor is not None:
+        log.info("%s: removed %.1fs of %.1fs audio before ASR",
+                 os.path.basename(filepath), preprocessor.removed_seconds,
+                 preprocessor.input_seconds)
+    return text
 
-@scheduler.task('interval', id='pipeline', seconds=10)
-def process_transcription():
-    uploads = Queue.query.filter_by(content=None).order_by(
-        Queue.timestamp.asc()).all()
-    for upload in uploads:
-        if not upload.content:
-            filename = upload.filename
-            file_dir_path = os.path.join(application.instance_path, 'files')
-            file_path = os.path.join(file_dir_path, filename)
-            if os.path.exists(file_path):
-                talk_to_text = transcribe(file_path)
-                os.remove(file_path)
-                result = prepare_note(spacy_model, talk_to_text)
-                upload.content = json.dumps(result)
+
+# One upload moving through the pipeline stages
+Job = namedtuple('Job', ['index', 'path', 'queued_at', 'text', 'result',
+                         'worker'])
+
+_pipeline = None
+_notes = None
+_pipeline_lock = threading.Lock()
+
+
+def _note_processes():
+    """NoteProcesses of the pipeline's NLP stage, None with one process"""
+    global _notes
+    processes = max(1, application.config.get('NLP_PROCESSES', 1))
+    if _notes is None and processes > 1:
+        _notes = NoteProcesses(processes)
+    return _notes
+
+
+def get_pipeline():
+    """The upload pipeline, started on first use: ASR_MAX_CONCURRENCY
+    transcription threads, NLP_PROCESSES forked extraction processes and a
+    writer committing results in batches, joined by bounded queues"""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            config = application.config
+            size = config.get('PIPELINE_QUEUE_SIZE', 16)
+            notes = _note_processes()
+            _pipeline = Pipeline('uploads', [
+                Stage('asr', _transcribe_jobs, asr_backend.max_concurrency,
+                      size),
+                Stage('nlp', functools.partial(_prepare_jobs, notes),
+                      notes.processes if notes else 1, size,
+                      batch_size=config.get('NLP_BATCH_SIZE', 8)),
+                Stage('write', _write_jobs, 1, size,
+                      batch_size=config.get('PIPELINE_WRITE_BATCH', 16),
+                      batch_wait=config.get('PIPELINE_WRITE_WAIT', 0.5))],
+                on_error=_release_jobs).start()
+        return _pipeline
+
+
+class NoteProcesses(object):
+    """Long-lived forked processes for the pipeline's NLP stage. They share
+    the live model copy-on-write and are forked again after a model swap;
+    the retired pool is closed and joined once its last batch is done"""
+
+    def __init__(self, processes):
+        self.processes = processes
+        self._model = None
+        self._pool = None
+        self._running = Counter()  # batches running on each pool
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Fork the processes for the current model"""
+        with self.checkout():
+            pass
+
+    @contextmanager
+    def checkout(self):
+        """(model, pool) of the current model for one batch"""
+        with self._lock:
+            model = model_registry.current()
+            retired = None
+            if self._model is not model:
+                previous = self._pool
+                context = multiprocessing.get_context('fork')
+                self._pool = context.Pool(self.processes, _set_batch_model,
+                                          (model,))
+                self._model = model
+                retired = self._retire(previous)
+            pool = self._pool
+            self._running[pool] += 1
+        self._join(retired)
+        try:
+            yield model, pool
+        finally:
+            with self._lock:
+                self._running[pool] -= 1
+                retired = self._retire(pool)
+            self._join(retired)
+
+    def _retire(self, pool):
+        """pool, when it is no longer current and has no batch running"""
+        if pool is None or pool is self._pool or self._running[pool]:
+            return None
+        del self._running[pool]
+        return pool
+
+    @staticmethod
+    def _join(pool):
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def _set_batch_model(model):
+    global _batch_model
+    _batch_model = model
+
+
+def _transcribe_jobs(batch):
+    transcribed = []
+    for job in batch:
+        metrics.observe('queue_wait', time.time() - job.queued_at)
+        with metrics.timed('asr'):
+            transcribed.append(job._replace(text=transcribe(job.path)))
+    return transcribed
+
+
+def _prepare_jobs(notes, batch):
+    texts = [job.text for job in batch]
+    if notes is None:
+        results = prepare_notes(model_registry.current(), texts,
+                                batch_size=len(batch), cache=result_cache)
+    else:
+        with notes.checkout() as (model, pool):
+            results = prepare_notes(model, texts, batch_size=len(batch),
+                                    cache=result_cache, pool=pool)
+    return [job._replace(result=result)
+            for job, result in zip(batch, results)]
+
+
+def _write_jobs(batch):
+    """Store a batch of results in one commit, then delete the recordings;
+    a crash before the commit leaves them to be claimed again. Results of
+    uploads another worker took over meanwhile are discarded"""
+    done = []
+    with application.app_context():
+        try:
+            for job in batch:
+                if jobs.finish(job.index, job.worker,
+                               {'content': job.result}):
+                    done.append(job)
+                else:
+                    log.warning("Upload %s was taken over by another "
+                                "worker, discarding its result", job.index)
+            with metrics.timed('db_commit'):
                 db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+    jobs.forget([job.index for job in batch])
+    metrics.JOBS.labels('done').inc(len(done))
+    for job in done:
+        if os.path.exists(job.path):
+            os.remove(job.path)
+    return []
+
+
+def _release_jobs(stage, batch, error):
+    metrics.JOBS.labels('error').inc(len(batch))
+    # job workers share the pipeline: a batch can mix their claims
+    claims = defaultdict(list)
+    for job in batch:
+        claims[job.worker].append(job.index)
+    with application.app_context():
+        try:
+            for worker, indexes in claims.items():
+                jobs.release(indexes, worker)
+        finally:
+            db.session.remove()
+
+
+def submit_uploads(uploads):
+    """Job handler: hand claimed Queue rows to the pipeline, blocking while
+    its first queue is full. Rows whose recording is missing fail"""
+    file_dir_path = os.path.join(application.instance_path, 'files')
+    ready = []
+    profiled = []
+    for upload in uploads:
+        file_path = os.path.join(file_dir_path, upload.filename)
+        if os.path.exists(file_path):
+            job = Job(upload.index, file_path, jobs.queued_at(upload),
+                      None, None, upload.worker)
+            reason = profiling.reason(upload.profile)
+            if reason is None:
+                ready.append(job)
+            else:
+                profiled.append((job, reason))
+        else:
+            upload.status = jobs.FAILED
+            metrics.JOBS.labels('failed').inc()
+            jobs.forget([upload.index])
+    db.session.commit()
+    pipeline = get_pipeline()
+    for job in ready:
+        pipeline.put(job)
+    for job, reason in profiled:
+        _process_profiled(job, reason)
+
+
+def _process_profiled(job, reason):
+    """Run one upload through every stage in this thread under a
+    ProfileRun. Extraction skips the result cache and the NLP processes,
+    so the profile shows each spaCy component"""
+    run = profiling.ProfileRun('job', 'process_transcription', reason,
+                               detail=os.path.basename(job.path))
+    try:
+        with run:
+            job, = _transcribe_jobs([job])
+            model = model_registry.current()
+            result, = prepare_notes(model, [job.text], batch_size=1)
+            _write_jobs([job._replace(result=result)])
+    except Exception as error:
+        log.exception("Profiled upload %s failed", job.index)
+        _release_jobs('profile', [job], error)
+    finally:
+        profiling.store.save(run)
+
+
+def process_transcription():
+    """Process every pending upload now, e.g. from a shell or a benchmark,
+    and wait until the results are written; the job workers started by
+    start_workers() do this continuously"""
+    worker = jobs.worker_name('drain')
+    limit = application.config.get('JOB_BATCH_SIZE', 8)
+    while jobs.process_next(submit_uploads, worker, limit):
+        pass
+    get_pipeline().join()
+
+
+def start_workers(count=None):
+    """Start the job worker threads that feed uploads to the pipeline as
+    they arrive. The NLP processes are forked first, before this process
+    runs any worker or pipeline thread"""
+    with _pipeline_lock:
+        notes = _note_processes()
+    if notes is not None:
+        notes.start()
+    return jobs.start_workers(submit_uploads, count)
+
+
+@scheduler.task('interval', id='pipeline-stats', seconds=60)
+def log_pipeline_stats():
+    """Log queue depth and throughput of each pipeline stage"""
+    if _pipeline is None:
+        return
+    stats = _pipeline.stats()
+    for stage in _pipeline.stages:
+        stage_stats = stats[stage.name]
+        log.info("Stage %s: %d/%d queued, %d done, %d failed, %.2f/s, "
+                 "%.0f%% busy", stage.name, stage_stats['queue_depth'],
+                 stage_stats['queue_size'], stage_stats['processed'],
+                 stage_stats['failed'], stage_stats['throughput'],
+                 100 * stage_stats['utilisation'])
+
+
+@scheduler.task('interval', id='model-refresh', seconds=60)
+def refresh_model():
+    """Hot-swap in a model version saved by retrain.py"""
+    model_registry.refresh()
@@ -0,0 +1,80 @@
+from app import application, db
+from datetime import datetime
+from flask import request
+import base64
+
+
+class Page(object):
+    """One page of rows, newest first. newer and older are the cursors of
+    the neighbouring pages, None at either end"""
+
+    def __init__(self, items, newer=None, older=None):
+        self.items = items
+        self.newer = newer
+        self.older = older
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(row):
+    """Opaque cursor for the (timestamp, index) key of a row"""
+    key = "{}|{}".format(row.timestamp.isoformat(), row.index)
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(timestamp, index) of a cursor, or None when it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = base64.urlsafe_b64decode(padded.encode()).decode()
+        timestamp, index = key.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(index)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def paginate(query, model, after=None, before=None, limit=None):
+    """Keyset pagination of query on (model.timestamp, model.index),
+    newest first: the page of rows older than cursor `after`, newer than
+    cursor `before`, or the newest rows. Each page is one index range scan
+    however many rows precede it, unlike OFFSET"""
+    limit = limit or application.config.get('PAGE_SIZE', 25)
+    key = db.tuple_(model.timestamp, model.index)
+    after = after and decode_cursor(after)
+    before = before and decode_cursor(before)
+    if before:
+        rows = query.filter(key > db.tuple_(*map(db.literal, before))) \
+            .order_by(model.timestamp.asc(), model.index.asc()) \
+            .limit(limit + 1).all()
+        if not rows:
+            return paginate(query, model, limit=limit)
+        more = len(rows) > limit
+        rows = rows[:limit][::-1]
+        return Page(rows, encode_cursor(rows[0]) if more else None,
+                    encode_cursor(rows[-1]))
+    if after:
+        query = query.filter(key < db.tuple_(*map(db.literal, after)))
+    rows = query.order_by(model.timestamp.desc(), model.index.desc()) \
+        .limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return Page(rows, encode_cursor(rows[0]) if after and rows else None,
+                encode_cursor(rows[-1]) if more else None)
+
+
+def page_args():
+    """after, before and limit of the current request; limit is capped at
+    MAX_PAGE_SIZE"""
+    config = application.config
+    try:
+        limit = int(request.args.get('limit', config.get('PAGE_SIZE', 25)))
+    except ValueError:
+        limit = config.get('PAGE_SIZE', 25)
+    limit = max(1, min(limit, config.get('MAX_PAGE_SIZE', 100)))
+    return {'after': request.args.get('after'),
+            'before': request.args.get('before'),
+            'limit': limit}
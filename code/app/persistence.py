@@ -0,0 +1,105 @@
+from app import db
+from app.classes import Data, History, Queue, SectionText
+from sqlalchemy.dialects import postgresql
+
+# rows per multi-row INSERT, well under Postgres' 32767 bind parameters
+INSERT_CHUNK = 1000
+
+
+def entity_offsets(reviewed):
+    """(subject_id, text, entity, start, end, label) for each reviewed
+    (subject_id, section text, label, entity line).
+
+    Medication lines keep only the drug name. Entities are located with
+    str.find, since reviewed text is literal, not a pattern; an entity
+    missing from its section is stored with its own text as the section"""
+    rows = []
+    for subject_id, text, label, entity in reviewed:
+        if label == "medication":
+            entity = entity.split(" ")[0]
+        start = text.find(entity)
+        if start == -1:
+            rows.append((subject_id, entity, entity, 0, len(entity), label))
+        else:
+            rows.append((subject_id, text, entity, start,
+                         start + len(entity), label))
+    return rows
+
+
+def bulk_insert(insert, rows):
+    """Run an INSERT statement for dicts in as few round trips as
+    possible: multi-row VALUES statements on Postgres, one executemany
+    elsewhere"""
+    if not rows:
+        return
+    if db.engine.dialect.name == 'postgresql':
+        for i in range(0, len(rows), INSERT_CHUNK):
+            chunk = rows[i:i + INSERT_CHUNK]
+            db.session.execute(insert.values(chunk))
+    else:
+        db.session.execute(insert, rows)
+
+
+def _insert_new_texts():
+    """INSERT into section_texts that skips hashes already stored, e.g.
+    by a concurrent review of the same note"""
+    table = SectionText.__table__
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing(
+            index_elements=['hash'])
+    return table.insert().prefix_with('OR IGNORE')
+
+
+def _section_text_ids(hashes):
+    return dict(db.session.query(SectionText.hash, SectionText.index)
+                .filter(SectionText.hash.in_(list(hashes))))
+
+
+def section_text_ids(texts):
+    """{text: section_texts id} for texts, storing those not seen before.
+    Texts already stored cost only their hash"""
+    texts = {SectionText.digest(text): text for text in set(texts)}
+    if not texts:
+        return {}
+    ids = _section_text_ids(texts)
+    new = [{'hash': hash, 'text': text} for hash, text in texts.items()
+           if hash not in ids]
+    if new:
+        bulk_insert(_insert_new_texts(), new)
+        ids.update(_section_text_ids(row['hash'] for row in new))
+    return {texts[hash]: id for hash, id in ids.items()}
+
+
+def save_review(queue_row, reviewed, physician_id, data_timestamp,
+                history_timestamp, diseases, meds, content):
+    """Store a physician's review of a note in one short transaction: the
+    section texts not stored yet, all transcriptions rows in bulk, the
+    history row and the removal of the queue row. Entity offsets are
+    computed before the first write, so locks are held only for the
+    statements themselves"""
+    entities = entity_offsets(reviewed)
+    history_row = History(id=physician_id,
+                          mrn=queue_row.mrn,
+                          transcription_id=queue_row.transcription_id,
+                          timestamp=history_timestamp,
+                          filename=queue_row.filename,
+                          content=content,
+                          diseases=diseases,
+                          meds=meds)
+    try:
+        text_ids = section_text_ids(row[1] for row in entities)
+        rows = [{'id': physician_id, 'mrn': queue_row.mrn,
+                 'transcription_id': queue_row.transcription_id,
+                 'section_text_id': text_ids[text], 'entity': entity,
+                 'start': start, 'end': end, 'label': label,
+                 'subject_id': subject_id, 'timestamp': data_timestamp}
+                for subject_id, text, entity, start, end, label in entities]
+        bulk_insert(Data.__table__.insert(), rows)
+        db.session.add(history_row)
+        Queue.query.filter_by(
+            transcription_id=queue_row.transcription_id).delete()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(rows)
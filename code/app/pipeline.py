@@ -0,0 +1,185 @@
+import logging
+import queue
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Started pipelines by name, for the stats in /health.
+pipelines = {}
+
+_STOP = object()
+
+
+class Stage(object):
+    """One step of a Pipeline.
+
+    `workers` threads take batches of up to batch_size items from a bounded
+    inbox, call work(items) and pass the items it returns on to the next
+    stage. A full inbox blocks the stage feeding it, so a slow stage holds
+    the earlier ones back instead of letting work pile up in memory."""
+
+    def __init__(self, name, work, workers=1, queue_size=16, batch_size=1,
+                 batch_wait=0.0):
+        self.name = name
+        self.work = work
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.inbox = queue.Queue(queue_size)
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Block for one item, then take whatever else arrives within
+        batch_wait, up to batch_size. Returns (items, stop)"""
+        item = self.inbox.get()
+        if item is _STOP:
+            return [], True
+        items = [item]
+        deadline = time.monotonic() + self.batch_wait
+        while len(items) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    item = self.inbox.get(timeout=timeout)
+                else:
+                    item = self.inbox.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def record(self, count, seconds, failed=False):
+        with self._lock:
+            self.batches += 1
+            self.busy_seconds += seconds
+            if failed:
+                self.failed += count
+            else:
+                self.processed += count
+
+    def stats(self, elapsed):
+        """Queue depth, throughput (items/s) and utilisation (share of the
+        workers' time spent working) since the pipeline started"""
+        elapsed = max(elapsed, 1e-9)
+        with self._lock:
+            return {'workers': self.workers,
+                    'queue_depth': self.inbox.qsize(),
+                    'queue_size': self.inbox.maxsize,
+                    'processed': self.processed,
+                    'failed': self.failed,
+                    'batches': self.batches,
+                    'busy_seconds': self.busy_seconds,
+                    'throughput': self.processed / elapsed,
+                    'utilisation': self.busy_seconds /
+                    (elapsed * self.workers)}
+
+
+class Pipeline(object):
+    """Stages joined by bounded queues, each running on its own threads so
+    that e.g. waiting on the network in one stage overlaps CPU work in the
+    next.
+
+    When a stage's work raises, on_error(stage_name, items, error) is called
+    and the items leave the pipeline."""
+
+    def __init__(self, name, stages, on_error=None):
+        self.name = name
+        self.stages = stages
+        self.on_error = on_error
+        self.started = None
+        self._threads = []
+        self._unfinished = 0
+        self._done = threading.Condition()
+
+    def start(self):
+        self.started = time.monotonic()
+        for position, stage in enumerate(self.stages):
+            for i in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._run, args=(position,), daemon=True,
+                    name='{}-{}-{}'.format(self.name, stage.name, i))
+                thread.start()
+                self._threads.append((position, thread))
+        pipelines[self.name] = self
+        return self
+
+    def put(self, item, timeout=None):
+        """Queue item for the first stage, blocking while it is full"""
+        with self._done:
+            self._unfinished += 1
+        try:
+            self.stages[0].inbox.put(item, timeout=timeout)
+        except queue.Full:
+            self._finish(1)
+            raise
+
+    def join(self, timeout=None):
+        """Wait until every item put so far has left the pipeline"""
+        with self._done:
+            return self._done.wait_for(lambda: not self._unfinished, timeout)
+
+    def stop(self):
+        """Let queued items finish, then stop the threads stage by stage"""
+        for position, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                stage.inbox.put(_STOP)
+            for thread_position, thread in self._threads:
+                if thread_position == position:
+                    thread.join()
+        pipelines.pop(self.name, None)
+
+    def stats(self):
+        elapsed = time.monotonic() - (self.started or time.monotonic())
+        stats = {stage.name: stage.stats(elapsed) for stage in self.stages}
+        stats['in_flight'] = self._unfinished
+        return stats
+
+    def _finish(self, count):
+        with self._done:
+            self._unfinished -= count
+            if not self._unfinished:
+                self._done.notify_all()
+
+    def _run(self, position):
+        stage = self.stages[position]
+        following = self.stages[position + 1] \
+            if position + 1 < len(self.stages) else None
+        stop = False
+        while not stop:
+            items, stop = stage.take()
+            if not items:
+                continue
+            begin = time.perf_counter()
+            try:
+                results = stage.work(items)
+            except Exception as error:
+                stage.record(len(items), time.perf_counter() - begin, True)
+                log.exception("Pipeline stage %s failed on %d items",
+                              stage.name, len(items))
+                if self.on_error is not None:
+                    try:
+                        self.on_error(stage.name, items, error)
+                    except Exception:
+                        log.exception("Pipeline error handler failed")
+                self._finish(len(items))
+                continue
+            stage.record(len(items), time.perf_counter() - begin)
+            if following is None:
+                self._finish(len(items))
+                continue
+            results = list(results)
+            self._finish(len(items) - len(results))
+            for result in results:
+                following.inbox.put(result)
+
+
+def report():
+    """Stats of every running pipeline"""
+    return {name: pipeline.stats() for name, pipeline in pipelines.items()}
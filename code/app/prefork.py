@@ -0,0 +1,102 @@
+import fcntl
+import gc
+import logging
+import os
+import time
+
+log = logging.getLogger(__name__)
+
+# Only one forked worker runs the scheduler and the job workers; the others
+# serve requests.
+_scheduler_lock = None
+
+
+def prepare_parent():
+    """Load everything workers share before they are forked.
+
+    Runs in the pre-fork parent: creates the tables, loads the model and
+    compiles the matchers, then moves every object into the permanent GC
+    generation. The collector never writes to frozen objects, so their pages
+    stay shared copy-on-write between the workers instead of being copied
+    into each one on the first collection.
+
+    The connections create_tables opened are closed last, so no worker
+    inherits, and shares, a pooled database socket."""
+    from app import db, startup, create_tables, load_model, model_registry
+    from app.matchers import registry
+
+    def compile_matchers():
+        registry.get(model_registry.current(), 'medications')
+
+    gc.disable()
+    startup.run([('create_all', create_tables), ('model', load_model),
+                 ('matchers', compile_matchers)])
+    db.engine.dispose()
+    gc.collect()
+    gc.freeze()
+
+
+def start_worker(lock_path=None):
+    """Per-worker start-up after fork: re-enable the collector (frozen
+    objects stay untouched) and start the scheduler and job workers in
+    whichever worker takes the lock first"""
+    global _scheduler_lock
+    from app import application, startup, start_scheduler, start_workers
+
+    gc.enable()
+    if lock_path is None:
+        lock_path = os.path.join(application.instance_path, 'scheduler.lock')
+    lock = open(lock_path, 'a')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return False
+    _scheduler_lock = lock  # held until the worker exits
+    # workers first: they fork the NLP processes before any thread runs
+    for name, step in (('workers', start_workers),
+                       ('scheduler', start_scheduler)):
+        begin = time.perf_counter()
+        step()
+        startup.record(name, time.perf_counter() - begin)
+    return True
+
+
+def memory_report(pid='self'):
+    """Unique and shared memory of a process in kB, from /proc smaps.
+
+    unique is what the process alone would free on exit (Private_*),
+    shared is resident memory also mapped by other processes (Shared_*),
+    and pss splits the shared part fairly between them."""
+    fields = {'Rss': 0, 'Pss': 0, 'Shared_Clean': 0, 'Shared_Dirty': 0,
+              'Private_Clean': 0, 'Private_Dirty': 0}
+    path = '/proc/{}/smaps_rollup'.format(pid)
+    if not os.path.exists(path):
+        path = '/proc/{}/smaps'.format(pid)
+    with open(path) as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name in fields:
+                fields[name] += int(value.split()[0])
+    return {'pid': os.getpid() if pid == 'self' else pid,
+            'rss': fields['Rss'], 'pss': fields['Pss'],
+            'unique': fields['Private_Clean'] + fields['Private_Dirty'],
+            'shared': fields['Shared_Clean'] + fields['Shared_Dirty']}
+
+
+def log_memory(pids):
+    """Log the memory report of each pid and the total unique/shared"""
+    reports = []
+    for pid in pids:
+        try:
+            reports.append(memory_report(pid))
+        except OSError:
+            continue
+    for report in reports:
+        log.info("Worker %(pid)s: unique %(unique)d kB, shared %(shared)d "
+                 "kB, pss %(pss)d kB", report)
+    if reports:
+        log.info("%d workers: unique %d kB total, shared %d kB each",
+                 len(reports), sum(r['unique'] for r in reports),
+                 max(r['shared'] for r in reports))
+    return reports
@@ -0,0 +1,231 @@
+from app import application
+from collections import defaultdict
+from contextlib import contextmanager
+from flask import request
+from flask_login import current_user
+from functools import wraps
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+
+_local = threading.local()
+_ID = re.compile(r'^[0-9a-f-]+$')
+
+
+class ProfileRun(object):
+    """cProfile output and per-component spaCy timings of one request or
+    job. While a run is active in a thread, run_profile and pipe_profile
+    (app.nlp) time every pipeline component they apply"""
+
+    def __init__(self, kind, name, reason, detail=None):
+        self.id = "{}-{}".format(time.strftime('%Y%m%d-%H%M%S'),
+                                 uuid.uuid4().hex[:8])
+        self.kind = kind
+        self.name = name
+        self.reason = reason
+        self.detail = detail
+        self.started = None
+        self.seconds = None
+        self.error = None
+        self.profiler = cProfile.Profile()
+        self.components = defaultdict(float)
+        self.calls = defaultdict(int)
+        self._inclusive = defaultdict(float)
+        self._upstream = {}
+
+    def __enter__(self):
+        self.started = time.time()
+        self._begin = time.perf_counter()
+        _local.run = self
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.disable()
+        _local.run = None
+        self.seconds = time.perf_counter() - self._begin
+        if exc_type is not None:
+            self.error = exc_type.__name__
+
+    @contextmanager
+    def timed(self, component):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.components[component] += time.perf_counter() - begin
+            self.calls[component] += 1
+
+    def stream(self, component, items, upstream=None):
+        """Pass items through, timing one step of a chain of generators.
+        A step's own time is what producing its items took minus the time
+        of the `upstream` step it pulls from"""
+        self._upstream[component] = upstream
+        iterator = iter(items)
+        while True:
+            begin = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._inclusive[component] += time.perf_counter() - begin
+            self.calls[component] += 1
+            yield item
+
+    def component_seconds(self):
+        seconds = dict(self.components)
+        for component, inclusive in self._inclusive.items():
+            upstream = self._upstream.get(component)
+            own = inclusive - self._inclusive.get(upstream, 0.0)
+            seconds[component] = seconds.get(component, 0.0) + own
+        return seconds
+
+    def stats_text(self, limit=60):
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def summary(self):
+        return {'id': self.id, 'kind': self.kind, 'name': self.name,
+                'reason': self.reason, 'detail': self.detail,
+                'started': self.started,
+                'started_at': time.strftime('%Y-%m-%d %H:%M:%S',
+                                            time.localtime(self.started)),
+                'seconds': self.seconds,
+                'error': self.error,
+                'components': {name: {'seconds': seconds,
+                                      'calls': self.calls[name]}
+                               for name, seconds in
+                               self.component_seconds().items()}}
+
+
+class ProfileStore(object):
+    """The most recent max_entries profiles in `directory`: a JSON summary
+    with the printed stats, and the raw cProfile dump for pstats or
+    snakeviz, per run. Oldest runs are deleted first"""
+
+    def __init__(self, directory, max_entries=50):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def _path(self, id, extension):
+        return os.path.join(self.directory, id + extension)
+
+    def save(self, run):
+        os.makedirs(self.directory, exist_ok=True)
+        record = run.summary()
+        record['stats'] = run.stats_text()
+        run.profiler.dump_stats(self._path(run.id, '.prof'))
+        path = self._path(run.id, '.json')
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(temp_path, 'w') as f:
+            json.dump(record, f)
+        os.replace(temp_path, path)
+        self.prune()
+        return run.id
+
+    def prune(self):
+        with self._lock:
+            ids = self._ids()
+            for id in ids[:max(0, len(ids) - self.max_entries)]:
+                for extension in ('.json', '.prof'):
+                    try:
+                        os.remove(self._path(id, extension))
+                    except OSError:
+                        pass
+
+    def _ids(self):
+        """Stored run ids, oldest first (ids start with the time)"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith('.json'))
+
+    def list(self):
+        """Summaries of the stored runs, newest first"""
+        runs = []
+        for id in reversed(self._ids()):
+            run = self.get(id)
+            if run is not None:
+                run.pop('stats', None)
+                runs.append(run)
+        return runs
+
+    def get(self, id):
+        if not _ID.match(id):
+            return None
+        try:
+            with open(self._path(id, '.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+def current():
+    """The ProfileRun active in this thread, if any"""
+    return getattr(_local, 'run', None)
+
+
+def reason(requested=False):
+    """Why to profile: 'requested', 'sampled' at PROFILE_SAMPLE_RATE, or
+    None to run normally"""
+    if requested:
+        return 'requested'
+    rate = application.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    if rate and random.random() < rate:
+        return 'sampled'
+    return None
+
+
+def is_admin(user):
+    """True when user is in PROFILE_ADMINS, so may request profiles and
+    view the stored runs; nobody is by default"""
+    admins = application.config.get('PROFILE_ADMINS') or ()
+    return user.is_authenticated and user.username in admins
+
+
+def requested():
+    """True when the current request asks to be profiled, with ?profile=1
+    or an X-Profile: 1 header, and comes from a profile admin"""
+    asked = request.args.get('profile') == '1' or \
+        request.headers.get('X-Profile') == '1'
+    return asked and is_admin(current_user)
+
+
+def profiled(name):
+    """View decorator: profile the request when it asks for it or is
+    sampled, and save the run to the store"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            why = reason(requested())
+            if why is None:
+                return view(*args, **kwargs)
+            run = ProfileRun('request', name, why, detail=request.path)
+            try:
+                with run:
+                    return view(*args, **kwargs)
+            finally:
+                store.save(run)
+        return wrapper
+    return decorator
+
+
+def make_store(config, instance_path):
+    return ProfileStore(config.get('PROFILE_DIR') or
+                        os.path.join(instance_path, 'profiles'),
+                        config.get('PROFILE_MAX_ENTRIES', 50))
+
+
+store = make_store(application.config, application.instance_path)
@@ -0,0 +1,83 @@
+from app import application, db
+from app.classes import Data, Queue, History, SectionText
+from datetime import datetime, timedelta
+import click
+import json
+
+
+def hot_queries():
+    """{name: (table, query)} for every lookup on a hot path, with
+    representative parameters"""
+    week_ago = datetime.utcnow() - timedelta(days=7)
+    return {
+        'queue by transcription': ('queue', Queue.query.filter_by(
+            transcription_id='00000000-0000-0000-0000-000000000000')),
+        'queue by physician': ('queue', Queue.query.filter_by(
+            id=1).order_by(Queue.timestamp.desc())),
+        'claimable jobs': ('queue', Queue.query.filter(
+            Queue.status == 'pending').order_by(Queue.timestamp.asc())),
+        'history by transcription': ('history', History.query.filter_by(
+            id=1, transcription_id='00000000-0000-0000-0000-000000000000')),
+        'history by physician': ('history', History.query.filter_by(
+            id=1).order_by(History.timestamp.desc())),
+        'history by physician and mrn': ('history', History.query.filter_by(
+            id=1, mrn=1234567).order_by(History.timestamp.desc())),
+        'training data of the week': ('transcriptions', Data.query.join(
+            Data.section_text).filter(Data.timestamp > week_ago)),
+        'section text by hash': ('section_texts', SectionText.query.filter(
+            SectionText.hash == SectionText.digest('')))}
+
+
+def explain(query):
+    """The database's plan for query, as text"""
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.connect() as connection:
+            # tiny tables are always scanned; ask whether an index is usable
+            connection.execute("SET enable_seqscan = off")
+            rows = connection.execute(
+                "EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params)
+            return json.dumps(rows.scalar())
+    params = [compiled.params[name] for name in compiled.positiontup]
+    rows = db.engine.execute("EXPLAIN QUERY PLAN " + str(compiled), params)
+    return "\n".join(str(row[-1]) for row in rows)
+
+
+def scans(plan, table):
+    """True when the plan reads the whole table instead of an index"""
+    if plan.startswith('['):
+        return _pg_scans(json.loads(plan)[0]['Plan'], table)
+    for line in plan.splitlines():
+        words = line.split()
+        if words[:1] == ['SCAN'] and table in words and \
+                'INDEX' not in words:
+            return True
+    return False
+
+
+def _pg_scans(node, table):
+    if node.get('Node Type') == 'Seq Scan' and \
+            node.get('Relation Name') == table:
+        return True
+    return any(_pg_scans(child, table) for child in node.get('Plans', ()))
+
+
+def check():
+    """[(name, plan)] of the hot queries that scan their table"""
+    problems = []
+    for name, (table, query) in hot_queries().items():
+        plan = explain(query)
+        if scans(plan, table):
+            problems.append((name, plan))
+    return problems
+
+
+@application.cli.command('check-query-plans')
+def check_query_plans():
+    """Fail when a hot query would scan its table instead of an index"""
+    problems = check()
+    for name, plan in problems:
+        click.echo("{}: full table scan\n{}".format(name, plan), err=True)
+    if problems:
+        raise SystemExit(1)
+    click.echo("All {} hot queries use an index".format(len(hot_queries())))
@@ -1,21 +1,24 @@
 from app import application, db
 from flask import render_template, redirect, url_for, \
-    flash, request, session, g
+    flash, request, session, g, jsonify, Response, abort, send_from_directory
 from flask_login import current_user, login_user, login_required, logout_user
-from app.classes import User, Data, Queue, History
+from app.classes import User, Queue, History
 from app.forms import LogInForm, RegistrationForm, UploadFileForm, \
     ModelResultsForm, SearchForm
-from app.nlp import prepare_note
-from app import db, login_manager, spacy_model
+from app import db, login_manager, startup, model_registry
+from app.prefork import memory_report
+from app.pipeline import report as pipeline_report
+from app import metrics, profiling
+from app.pagination import paginate, page_args
+from app.persistence import save_review
+from app import jobs
 from datetime import timedelta, datetime
 from flask_wtf import FlaskForm
 from werkzeug import secure_filename
-import speech_recognition as sr
 import os
 import uuid
-import re
 import pytz
-import json
+import time
 
 
 @application.route('/', methods=('GET', 'POST'))
@@ -98,22 +101,27 @@ def upload(user):
         elif len(mrn) != 7 or not mrn.isnumeric():
             flash('MRN must be a 7 digit number')
         else:
-            file_dir_path = os.path.join(application.instance_path, 'files')
-            file_path = os.path.join(file_dir_path, filename)
-            f.save(file_path)
-
-            # Add this to the queue table
-            current_id = User.query.filter_by(username=user).first().id
-            transcription_id = str(uuid.uuid4())
-            now_utc = pytz.utc.localize(datetime.utcnow())
-            now_pst = now_utc - timedelta(hours=7)
-            upload_row = Queue(id=current_id,
-                               mrn=mrn,
-                               transcription_id=transcription_id,
-                               timestamp=now_pst,
-                               filename=filename)
-            db.session.add(upload_row)
-            db.session.commit()
+            with metrics.timed('upload_save'):
+                file_dir_path = os.path.join(application.instance_path,
+                                             'files')
+                file_path = os.path.join(file_dir_path, filename)
+                f.save(file_path)
+
+                # Add this to the queue table
+                current_id = User.query.filter_by(username=user).first().id
+                transcription_id = str(uuid.uuid4())
+                now_utc = pytz.utc.localize(datetime.utcnow())
+                now_pst = now_utc - timedelta(hours=7)
+                upload_row = Queue(id=current_id,
+                                   mrn=mrn,
+                                   transcription_id=transcription_id,
+                                   timestamp=now_pst,
+                                   filename=filename)
+                upload_row.profile = profiling.requested()
+                db.session.add(upload_row)
+                db.session.commit()
+            metrics.UPLOADS.inc()
+            jobs.notify()
 
             return redirect(url_for('queue', user=user))
     return render_template('upload.html', form=file)
@@ -123,17 +131,20 @@ def upload(user):
 @login_required
 def queue(user):
     current_id = User.query.filter_by(username=user).first().id
-    uploads = Queue.query.filter_by(id=current_id
-                                    ).order_by(Queue.timestamp.desc()).all()
+    uploads = paginate(Queue.summaries().filter_by(id=current_id), Queue,
+                       **page_args())
     return render_template('recent_uploads.html', uploads=uploads)
 
 
 @application.route('/results/<user>/<transcription>', methods=['GET', 'POST'])
 @login_required
+@profiling.profiled('results')
 def results(user, transcription):
-    queue_row = Queue.query.filter_by(transcription_id=transcription).first()
+    begin = time.perf_counter()
+    queue_row = Queue.with_payload().filter_by(
+        transcription_id=transcription).first()
     mrn = queue_row.mrn
-    result = json.loads(queue_row.content)
+    result = queue_row.content
 
     form = ModelResultsForm()
     if form.validate_on_submit():
@@ -211,52 +222,15 @@ def results(user, transcription):
                              result['impression']['text'],
                              'disease', ent_d))
 
-        for t in range(len(row_info)):
-            sub_id = row_info[t][0]
-            txt = row_info[t][1]
-            label = row_info[t][2]
-            if label == "medication":
-                entity = row_info[t][3].split(" ")[0]
-            else:
-                entity = row_info[t][3]
-
-            if entity in txt:
-                start = re.search(entity, txt).start()
-                end = re.search(entity, txt).end()
-            else:
-                txt = entity
-                start = 0
-                end = len(entity)
-
-            upload_row = Data(id=current_id,
-                              mrn=mrn,
-                              transcription_id=transcription,
-                              text=txt,
-                              entity=entity,
-                              start=start,
-                              end=end,
-                              label=label,
-                              subject_id=sub_id,
-                              timestamp=now_pst)
-            db.session.add(upload_row)
-
-        # Add it to the history table
+        # Add the entities and the history row, and remove the queue row
         now_utc = pytz.utc.localize(datetime.utcnow())
         timestamp = now_utc.astimezone(pytz.timezone("America/Los_Angeles"))
-        history_row = History(id=current_id,
-                              mrn=mrn,
-                              transcription_id=transcription,
-                              timestamp=timestamp,
-                              filename=queue_row.filename,
-                              content=queue_row.content,
-                              diseases=json.dumps(db_diseases),
-                              meds=json.dumps(db_meds))
-        db.session.add(history_row)
-
-        # Delete the row from the Queue Table
-        Queue.query.filter_by(transcription_id=transcription).delete()
-
-        db.session.commit()
+        save_review(queue_row, row_info, current_id,
+                    data_timestamp=now_pst,
+                    history_timestamp=timestamp,
+                    diseases=db_diseases,
+                    meds=db_meds,
+                    content=queue_row.content)
 
         # if the query table not empty for this user,
         # then re-direct to the queue
@@ -322,47 +296,121 @@ def results(user, transcription):
 
         form.assessment_diseases.data = assessment_diseases_string
 
-        return render_template(
+        page = render_template(
             'results.html', form=form, result=result, len=len(result))
+        metrics.observe('results_render', time.perf_counter() - begin)
+        return page
 
 
 @application.route('/history/<user>', methods=['GET', 'POST'])
 @login_required
+@profiling.profiled('history')
 def history(user):
     current_id = User.query.filter_by(username=user).first().id
-    uploads = History.query.filter_by(id=current_id).order_by(
-        History.timestamp.desc()).all()
     reset_option = False
 
+    # the MRN search is kept in the URL so it carries over between pages
     form = SearchForm()
     if form.validate_on_submit() and form.search.data:
-        uploads = History.query.filter_by(id=current_id,
-                                          mrn=form.search_text.data
-                                          ).order_by(
-            History.timestamp.desc()).all()
+        return redirect(url_for('history', user=user,
+                                mrn=form.search_text.data))
+    if request.method == 'POST':
+        return redirect(url_for('history', user=user))
+
+    query = History.summaries().filter_by(id=current_id)
+    mrn = request.args.get('mrn')
+    if mrn:
+        if len(mrn) != 7 or not mrn.isnumeric():
+            flash('MRN must be a 7 digit number')
+            return redirect(url_for('history', user=user))
+        query = query.filter_by(mrn=int(mrn))
+        form.search_text.data = mrn
         reset_option = True
+    uploads = paginate(query, History, **page_args())
 
     return render_template('history.html', form=form, uploads=uploads,
-                           reset=reset_option)
+                           reset=reset_option, mrn=mrn)
+
+
+# sections shown by report.html
+REPORT_SECTIONS = (
+    "history of present illness", "past medical and surgical history",
+    "medications prior to admission", "allergies", "family history",
+    "social history", "review of systems", "physical examination",
+    "electrocardiogram", "impression", "recommendations")
 
 
 @application.route('/report/<user>/<transcription>', methods=['GET', 'POST'])
 @login_required
+@profiling.profiled('report')
 def report(user, transcription):
-    history_row = History.query.filter_by(transcription_id=transcription
-                                          ).first()
-    mrn = history_row.mrn
-    result = json.loads(history_row.content)
+    found = History.report(current_user.id, transcription, REPORT_SECTIONS)
+    if found is None:
+        abort(404)
+    result, diseases, meds = found
     proper_title_keys = [
         k.title() for k in list(result.keys())]
 
-    diseases = json.loads(history_row.diseases)
-    meds = json.loads(history_row.meds)
-
     return render_template('report.html', titles=proper_title_keys,
                            result=result, diseases=diseases, meds=meds)
 
 
+@application.route('/health')
+def health():
+    """Readiness, startup-time breakdown, this worker's unique/shared
+    memory and pipeline stage stats; 503 until warm-up is done"""
+    report = startup.report()
+    report['model'] = model_registry.model_dir
+    report['pipelines'] = pipeline_report()
+    try:
+        report['memory'] = memory_report()
+    except OSError:
+        pass
+    return jsonify(report), 200 if startup.ready else 503
+
+
+@application.route('/metrics')
+def metrics_endpoint():
+    """Latency histograms and counters in Prometheus text format"""
+    body, content_type = metrics.exposition()
+    return Response(body, content_type=content_type)
+
+
+@application.route('/profiles')
+@login_required
+def profiles():
+    """Saved profiling runs, newest first"""
+    _check_profile_admin()
+    return render_template('profiles.html', runs=profiling.store.list())
+
+
+@application.route('/profiles/<id>')
+@login_required
+def profile(id):
+    """cProfile stats and spaCy component timings of one run"""
+    _check_profile_admin()
+    run = profiling.store.get(id)
+    if run is None:
+        abort(404)
+    return render_template('profile.html', run=run)
+
+
+@application.route('/profiles/<id>/dump')
+@login_required
+def profile_dump(id):
+    """Raw cProfile dump of a run, for pstats or snakeviz"""
+    _check_profile_admin()
+    if profiling.store.get(id) is None:
+        abort(404)
+    return send_from_directory(profiling.store.directory, id + '.prof',
+                               as_attachment=True)
+
+
+def _check_profile_admin():
+    if not profiling.is_admin(current_user):
+        abort(403)
+
+
 @application.route('/about')
 def about():
     return render_template('about_us.html')
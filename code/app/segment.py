@@ -0,0 +1,95 @@
+from app.matchers import TERMINOLOGY
+from collections import deque
+
+
+class HeaderIndex(object):
+    """Aho-Corasick automaton over the section headers.
+
+    Built once from TERMINOLOGY, it finds every header occurrence in a
+    single linear scan of the raw transcript, without running the model."""
+
+    def __init__(self, terms=TERMINOLOGY):
+        self.terms = [term.lower() for term in terms]
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for term in self.terms:
+            state = 0
+            for char in term:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._out[state].append(term)
+
+        # breadth-first so every fail link points at a finished state
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, child in self._goto[state].items():
+                pending.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] + \
+                    self._out[self._fail[child]]
+
+    def find(self, text):
+        """Whole-word, case-insensitive header matches as (start, end, term),
+        leftmost-longest and non-overlapping"""
+        lowered = _lower(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        hits = []
+        state = 0
+        for pos, char in enumerate(lowered):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for term in out[state]:
+                end = pos + 1
+                start = end - len(term)
+                if _is_boundary(text, start - 1) and _is_boundary(text, end):
+                    hits.append((start, end, term))
+
+        hits.sort(key=lambda hit: (hit[0], -hit[1]))
+        headers = []
+        last_end = 0
+        for hit in hits:
+            if hit[0] >= last_end:
+                headers.append(hit)
+                last_end = hit[1]
+        return headers
+
+
+def _lower(text):
+    """Lowercase without changing the length, so offsets stay valid"""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return ''.join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+def _is_boundary(text, pos):
+    return pos < 0 or pos >= len(text) or not text[pos].isalnum()
+
+
+def split_sections(text, index=None):
+    """Character spans of the text under each header, in order, as
+    (category, start, end); surrounding whitespace is excluded"""
+    headers = (index or header_index).find(text)
+    sections = []
+    for i in range(len(headers)):
+        start = headers[i][1]
+        end = headers[i + 1][0] if i < len(headers) - 1 else len(text)
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        sections.append((headers[i][2], start, end))
+    return sections
+
+
+header_index = HeaderIndex()
@@ -0,0 +1,61 @@
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class Startup(object):
+    """Readiness of the app and how long each warm-up step took.
+
+    state is 'cold' until warm-up starts, then 'warming', and 'ready' or
+    'failed' once every step has run."""
+
+    def __init__(self):
+        self.state = 'cold'
+        self.timings = OrderedDict()
+        self.error = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def record(self, name, seconds):
+        self.timings[name] = seconds
+
+    def run(self, steps, background=False):
+        """Run the (name, function) steps in order, timing each one"""
+        with self._lock:
+            if self.state in ('warming', 'ready'):
+                return self._thread
+            self.state = 'warming'
+        if not background:
+            self._run(steps)
+            return None
+        self._thread = threading.Thread(target=self._run, args=(steps,),
+                                        name='warm-up', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def _run(self, steps):
+        try:
+            for name, function in steps:
+                begin = time.perf_counter()
+                function()
+                self.record(name, time.perf_counter() - begin)
+        except Exception as e:
+            self.error = repr(e)
+            self.state = 'failed'
+            log.exception("Warm-up failed")
+            raise
+        self.state = 'ready'
+        log.info("Startup: %s", ", ".join(
+            "{} {:.2f}s".format(name, seconds)
+            for name, seconds in self.timings.items()))
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def report(self):
+        return {'state': self.state, 'error': self.error,
+                'timings': dict(self.timings)}
@@ -0,0 +1,308 @@
+"""Benchmarks for the NLP and ingest paths.
+
+    python benchmark.py --output results.json --baseline baseline.json
+
+Generates synthetic dictations of several sizes and section mixes, and
+times categorize_note, parse_entities and prepare_note on each, reporting
+throughput and latency percentiles. The end-to-end case writes synthetic
+WAV recordings, queues them in a scratch SQLite database and times
+process_transcription with the fixture ASR backend, which returns the
+dictation saved next to each recording.
+
+The report also compares each pipeline profile (the components a stage
+runs) with the full pipeline on the same transcripts.
+
+Results are written as JSON. With --baseline, every case is compared with
+the saved run and the exit status is 1 when a latency percentile grew, or
+throughput fell, by more than --tolerance, so model upgrades and code
+changes can be gated on it. --update-baseline saves the run as the new
+baseline."""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+import wave
+from datetime import datetime
+
+import numpy
+
+# the app reads these when imported: a scratch database and no network ASR
+SCRATCH_DIR = tempfile.mkdtemp(prefix='armr-bench-')
+os.environ.setdefault("ARMR_DATABASE_URL", "sqlite:///{}".format(
+    os.path.join(SCRATCH_DIR, 'armr.db')))
+os.environ.setdefault("ARMR_ASR_BACKEND", "fixture")
+
+from app import application, db, model_registry, create_tables
+from app.classes import Queue
+from app.matchers import TERMINOLOGY, model_version
+from app import jobs, nlp
+
+DISEASES = [
+    "hypertension", "atrial fibrillation", "diabetes mellitus", "asthma",
+    "chronic kidney disease", "coronary artery disease", "heart failure",
+    "pneumonia", "hyperlipidemia", "chronic obstructive pulmonary disease"]
+MEDICATIONS = [
+    "aspirin 81 mg daily", "metoprolol 25 mg orally", "lisinopril 10 mg",
+    "atorvastatin 40 mg at bedtime", "metformin 500 mg twice daily",
+    "warfarin", "furosemide 20 mg orally", "penicillin"]
+FILLER = [
+    "the patient reports feeling well overall",
+    "symptoms started about three days ago",
+    "no recent travel or sick contacts",
+    "vital signs were stable on arrival",
+    "will follow up in clinic in two weeks"]
+
+# sentences per section
+SIZES = {'short': 1, 'medium': 5, 'long': 40}
+# sections dictated
+MIXES = {
+    'all': TERMINOLOGY,
+    'core': ["history of present illness", "medications prior to admission",
+             "allergies", "impression"],
+    'no-headers': []}
+
+PERCENTILES = (50, 90, 99)
+
+
+def synthetic_sentence(rng):
+    kind = rng.random()
+    if kind < 0.4:
+        return "{} with {}".format(rng.choice(FILLER), rng.choice(DISEASES))
+    if kind < 0.7:
+        return "currently taking {}".format(rng.choice(MEDICATIONS))
+    return rng.choice(FILLER)
+
+
+def synthetic_note(rng, sentences, sections):
+    """Dictation-style transcript: lower case, no punctuation besides the
+    periods the ASR inserts, with `sentences` sentences per section"""
+    parts = []
+    for header in sections or [None]:
+        body = ". ".join(synthetic_sentence(rng) for _ in range(sentences))
+        parts.append(body if header is None
+                     else "{} {}".format(header, body))
+    return ". ".join(parts) + "."
+
+
+def synthetic_corpus(seed=0, notes=20):
+    """{(size, mix): [transcript]} for every size and section mix"""
+    rng = random.Random(seed)
+    return {(size, mix): [synthetic_note(rng, sentences, sections)
+                          for _ in range(notes)]
+            for size, sentences in SIZES.items()
+            for mix, sections in MIXES.items()}
+
+
+def synthetic_wav(path, seconds, rate=16000, seed=0):
+    """Speech-like mono recording: bursts of modulated tones separated by
+    pauses of near silence, so segmenting and silence compression have
+    real work to do"""
+    rng = numpy.random.RandomState(seed)
+    samples = numpy.zeros(int(seconds * rate), dtype=numpy.float32)
+    position = 0
+    while position < len(samples):
+        burst = int(rng.uniform(0.2, 1.5) * rate)
+        t = numpy.arange(burst) / float(rate)
+        pitch = rng.uniform(100, 300)
+        tone = numpy.sin(2 * numpy.pi * pitch * t) * \
+            (0.5 + 0.5 * numpy.sin(2 * numpy.pi * 4 * t))
+        end = min(len(samples), position + burst)
+        samples[position:end] = 0.3 * tone[:end - position]
+        position = end + int(rng.uniform(0.1, 1.0) * rate)
+    samples += rng.normal(0, 0.001, len(samples)).astype(numpy.float32)
+    pcm = (numpy.clip(samples, -1, 1) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm.tobytes())
+
+
+def summarize(latencies, wall_seconds=None):
+    """Throughput (items/s) and latency percentiles (ms) of one case"""
+    latencies = numpy.asarray(latencies) * 1000
+    wall_seconds = wall_seconds or latencies.sum() / 1000
+    summary = {'count': len(latencies),
+               'throughput': float(len(latencies) / wall_seconds),
+               'mean_ms': float(latencies.mean())}
+    for p in PERCENTILES:
+        summary['p{}_ms'.format(p)] = float(numpy.percentile(latencies, p))
+    summary['max_ms'] = float(latencies.max())
+    return summary
+
+
+def time_each(func, texts, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for text in texts:
+            begin = time.perf_counter()
+            func(text)
+            latencies.append(time.perf_counter() - begin)
+    return latencies
+
+
+def bench_nlp(model, corpus, repeat=1):
+    """Per-transcript latency of each extraction entry point, per case"""
+    functions = {
+        'categorize_note': lambda text: nlp.categorize_note(model, text),
+        'parse_entities': lambda text: nlp.parse_entities(model, text),
+        'prepare_note': lambda text: nlp.prepare_note(model, text)}
+    results = {}
+    for (size, mix), texts in sorted(corpus.items()):
+        for name, func in functions.items():
+            func(texts[0])  # warm-up
+            results['{}/{}/{}'.format(name, size, mix)] = summarize(
+                time_each(func, texts, repeat))
+    return results
+
+
+def bench_end_to_end(uploads=10, wav_seconds=45, size='medium', seed=0,
+                     asr_latency=0.0):
+    """Queue `uploads` synthetic recordings and time process_transcription
+    draining them through ASR, extraction and the database"""
+    files_dir = os.path.join(SCRATCH_DIR, 'files')
+    os.makedirs(files_dir, exist_ok=True)
+    application.instance_path = SCRATCH_DIR
+    nlp.asr_backend.latency = asr_latency
+    create_tables()
+
+    rng = random.Random(seed)
+    timestamp = datetime.utcnow() + jobs.TIMESTAMP_OFFSET
+    for i in range(uploads):
+        filename = 'bench-{}.wav'.format(i)
+        stem = os.path.join(files_dir, filename[:-4])
+        synthetic_wav(stem + '.wav', wav_seconds, seed=seed + i)
+        with open(stem + '.txt', 'w') as f:
+            f.write(synthetic_note(rng, SIZES[size], TERMINOLOGY))
+        db.session.add(Queue(id=1, mrn=1000000 + i,
+                             transcription_id=str(uuid.uuid4()),
+                             timestamp=timestamp, filename=filename))
+    db.session.commit()
+
+    begin = time.perf_counter()
+    nlp.process_transcription()
+    wall = time.perf_counter() - begin
+    done = Queue.with_payload().filter_by(status=jobs.DONE).all()
+    # a stand-in ASR that lost its transcripts would time NLP on nothing
+    empty = [row.filename for row in done
+             if all(section['text'] == "None"
+                    for section in (row.content or {}).values())]
+    Queue.query.delete()
+    db.session.commit()
+    if len(done) != uploads:
+        raise RuntimeError("{} of {} uploads processed".format(
+            len(done), uploads))
+    if empty:
+        raise RuntimeError("No sections extracted from {}".format(
+            ", ".join(empty)))
+    return {'process_transcription/{:g}s'.format(wav_seconds): {
+        'count': uploads, 'throughput': uploads / wall,
+        'wall_seconds': wall,
+        'audio_seconds_per_second': uploads * wav_seconds / wall}}
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Regressions beyond tolerance (a fraction) against the baseline:
+    [(case, metric, baseline value, new value)]"""
+    regressions = []
+    for case, summary in results.items():
+        old = baseline.get(case)
+        if old is None:
+            continue
+        for metric, value in summary.items():
+            if metric not in old or metric == 'count':
+                continue
+            if metric.endswith('_ms') or metric == 'wall_seconds':
+                worse = value > old[metric] * (1 + tolerance)
+            else:
+                worse = value < old[metric] * (1 - tolerance)
+            if worse:
+                regressions.append((case, metric, old[metric], value))
+    return regressions
+
+
+def environment(model):
+    import spacy
+
+    return {'python': platform.python_version(),
+            'spacy': spacy.__version__,
+            'model': model_version(model),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'nlp_processes': application.config.get('NLP_PROCESSES'),
+            'date': datetime.utcnow().isoformat()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--model', help="model directory (default: newest "
+                        "version in ../models)")
+    parser.add_argument('--notes', type=int, default=20,
+                        help="transcripts per size and section mix")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--uploads', type=int, default=10,
+                        help="recordings for the end-to-end case (0 skips)")
+    parser.add_argument('--wav-seconds', type=float, default=45)
+    parser.add_argument('--asr-latency', type=float, default=0.0,
+                        help="seconds the stand-in ASR waits per call")
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--baseline')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    try:
+        if args.model:
+            model_registry.load(args.model)
+        model = model_registry.current()
+        corpus = synthetic_corpus(args.seed, args.notes)
+        results = bench_nlp(model, corpus, args.repeat)
+        profiles = nlp.profile_report(model, corpus[('medium', 'all')])
+        if args.uploads:
+            results.update(bench_end_to_end(
+                args.uploads, args.wav_seconds, seed=args.seed,
+                asr_latency=args.asr_latency))
+    finally:
+        shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+
+    report = {'environment': environment(model), 'results': results,
+              'profiles': profiles}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    for case, summary in sorted(results.items()):
+        line = "{:45} {:9.1f}/s".format(case, summary['throughput'])
+        for p in PERCENTILES:
+            if 'p{}_ms'.format(p) in summary:
+                line += "  p{} {:8.1f} ms".format(
+                    p, summary['p{}_ms'.format(p)])
+        print(line)
+    for profile, timing in sorted(profiles.items()):
+        print("profile {:12} {:8.1f} ms/note, full pipeline {:8.1f} ms, "
+              "saves {:8.1f} ms ({})".format(
+                  profile, timing['profile'] * 1000, timing['full'] * 1000,
+                  timing['saved'] * 1000,
+                  ", ".join(timing['components'])))
+
+    status = 0
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for case, metric, old, new in regressions:
+            print("REGRESSION {} {}: {:.2f} -> {:.2f}".format(
+                case, metric, old, new))
+        status = 1 if regressions else 0
+    if args.baseline and args.update_baseline:
+        shutil.copyfile(args.output, args.baseline)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
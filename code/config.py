@@ -1,8 +1,55 @@
+import os
+
+
 class Config(object):
     """Connect to database."""
     user = "armrMaster"  # replace with server username
     pw = "armr_pw603"  # replace with server password
-    SQLALCHEMY_DATABASE_URI = f"postgresql://{user}:\
-{pw}@armr.c4eooxhj8ss8.us-west-1.rds.amazonaws.com:5432/armr"
+    # ARMR_DATABASE_URL overrides, e.g. sqlite:// for benchmarks
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        "ARMR_DATABASE_URL", f"postgresql://{user}:\
+{pw}@armr.c4eooxhj8ss8.us-west-1.rds.amazonaws.com:5432/armr")
     SQLALCHEMY_TRACK_MODIFICATIONS = True
     SCHEDULER_API_ENABLED = True
+    # batch extraction used to drain the upload backlog
+    NLP_BATCH_SIZE = 8
+    NLP_PROCESSES = os.cpu_count() or 1
+    # prepare_note result cache: None, 'memory' or 'disk'
+    RESULT_CACHE = None
+    RESULT_CACHE_SIZE = 1024
+    RESULT_CACHE_DIR = None  # defaults to <instance>/cache
+    # speech-to-text: 'google' (network), 'sphinx' (offline) or 'fixture'
+    # (deterministic stand-in reading <recording>.txt, for load tests)
+    ASR_BACKEND = os.environ.get("ARMR_ASR_BACKEND", "google")
+    ASR_MAX_CONCURRENCY = 4
+    ASR_TIMEOUT = 120  # seconds per call
+    ASR_SEGMENT_SECONDS = 30  # longer recordings are split; None disables
+    ASR_FIXTURE_DIR = None
+    ASR_FIXTURE_TEXT = ""
+    ASR_FIXTURE_LATENCY = 0.0
+    # audio clean-up before ASR: downmix, resample, compress silences
+    AUDIO_PREPROCESS = True
+    ASR_SAMPLE_RATE = 16000
+    AUDIO_SILENCE_DB = -40.0  # frames quieter than this (dBFS) are silence
+    AUDIO_MAX_SILENCE = 0.3  # seconds of each silence that are kept
+    # upload job workers (app.jobs); 0 leaves processing to worker.py
+    JOB_WORKERS = int(os.environ.get("ARMR_JOB_WORKERS", 1))
+    JOB_BATCH_SIZE = 16  # uploads claimed at once
+    JOB_POLL_SECONDS = 10  # fallback when no upload notification arrives
+    JOB_CLAIM_TIMEOUT = 600  # claims older than this are taken over
+    JOB_MAX_ATTEMPTS = 3
+    # staged upload pipeline (app.pipeline): bound of the queue in front of
+    # each stage, and how many results the writer commits at once
+    PIPELINE_QUEUE_SIZE = 16
+    PIPELINE_WRITE_BATCH = 16
+    PIPELINE_WRITE_WAIT = 0.5  # seconds the writer waits to fill a batch
+    # opt-in profiling (app.profiling): ?profile=1 on a page or upload by
+    # one of PROFILE_ADMINS, or a sampled share of requests and jobs; runs
+    # are listed at /profiles
+    PROFILE_SAMPLE_RATE = 0.0
+    PROFILE_DIR = None  # defaults to <instance>/profiles
+    PROFILE_MAX_ENTRIES = 50
+    PROFILE_ADMINS = []  # usernames allowed to request and view runs
+    # rows per page of the queue and history views (?limit= up to the max)
+    PAGE_SIZE = 25
+    MAX_PAGE_SIZE = 100
@@ -0,0 +1,64 @@
+import os
+
+# the app reads these when imported: an in-memory database, no network ASR
+# and no background job workers
+os.environ.setdefault("ARMR_DATABASE_URL", "sqlite://")
+os.environ.setdefault("ARMR_ASR_BACKEND", "fixture")
+os.environ.setdefault("ARMR_JOB_WORKERS", "0")
+
+import pytest
+
+from app import application, db
+
+
+@pytest.fixture
+def database():
+    """The schema on a fresh in-memory database, dropped afterwards"""
+    with application.app_context():
+        db.create_all()
+        yield db
+        db.session.remove()
+        db.drop_all()
+
+
+# what the stand-in model tags: whole words, case-insensitive
+DISEASES = ('atrial fibrillation', 'hypertension', 'chest pain', 'angina')
+CHEMICALS = ('aspirin', 'metoprolol', 'lisinopril', 'penicillin')
+
+
+def tag_entities(doc):
+    """'ner' of the stand-in model: DISEASE and CHEMICAL spans found by
+    string search, so tests of the extraction code need no trained model"""
+    lowered = doc.text.lower()
+    spans = []
+    for label, terms in (('DISEASE', DISEASES), ('CHEMICAL', CHEMICALS)):
+        for term in terms:
+            start = lowered.find(term)
+            while start != -1:
+                span = doc.char_span(start, start + len(term), label=label)
+                if span is not None:
+                    spans.append(span)
+                start = lowered.find(term, start + 1)
+    doc.ents = sorted(spans, key=lambda span: span.start)
+    return doc
+
+
+@pytest.fixture(scope='session')
+def stand_in_model():
+    """Blank English pipeline whose 'ner' is tag_entities"""
+    spacy = pytest.importorskip('spacy')
+    model = spacy.blank('en')
+    model.add_pipe(tag_entities, name='ner')
+    return model
+
+
+@pytest.fixture(scope='session')
+def trained_model():
+    """The newest model under ../models; skipped when there is none"""
+    pytest.importorskip('spacy')
+    from app import model_registry
+
+    try:
+        return model_registry.current()
+    except (IOError, OSError) as error:
+        pytest.skip("No trained model: {}".format(error))
@@ -1,2 +1,2 @@
 screen -S test -d -m
-screen -S test -d -m bash -c "cd ARMR/code; sudo ~/.conda/envs/armr/bin/flask run"
\ No newline at end of file
+screen -S test -d -m bash -c "cd ARMR/code; sudo ~/.conda/envs/armr/bin/python run_app.py"
\ No newline at end of file
@@ -0,0 +1,44 @@
+"""Pre-fork serving: gunicorn -c gunicorn.conf.py app:application
+
+The parent loads the model and compiles the matchers once, then forks the
+workers, which share those pages copy-on-write instead of each loading
+their own copy (see app.prefork).
+
+Set prometheus_multiproc_dir to an empty directory so /metrics merges the
+values of every worker (see app.metrics)."""
+import multiprocessing
+import os
+
+bind = "0.0.0.0:80"
+workers = int(os.environ.get("ARMR_WORKERS",
+                             multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+timeout = 120
+
+
+def when_ready(server):
+    from app.prefork import prepare_parent
+    prepare_parent()
+
+
+def post_fork(server, worker):
+    from app.prefork import start_worker
+    if start_worker():
+        server.log.info("Worker %s runs the scheduler", worker.pid)
+
+
+def post_worker_init(worker):
+    from app.prefork import memory_report
+    worker.log.info("Worker %(pid)s: unique %(unique)d kB, "
+                    "shared %(shared)d kB", memory_report())
+
+
+def nworkers_changed(server, new_value, old_value):
+    from app.prefork import log_memory
+    log_memory(list(server.WORKERS))
+
+
+def child_exit(server, worker):
+    if 'prometheus_multiproc_dir' in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
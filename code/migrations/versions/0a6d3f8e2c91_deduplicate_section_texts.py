@@ -0,0 +1,93 @@
+"""store each section text once, in section_texts
+
+Revision ID: 0a6d3f8e2c91
+Revises: f7b2c85d1e40
+Create Date: 2019-05-30 11:05:52.640217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import hashlib
+
+
+# revision identifiers, used by Alembic.
+revision = '0a6d3f8e2c91'
+down_revision = 'f7b2c85d1e40'
+branch_labels = None
+depends_on = None
+
+# distinct texts hashed and inserted per round trip
+BATCH = 1000
+
+transcriptions = sa.table('transcriptions',
+                          sa.column('index', sa.Integer),
+                          sa.column('text', sa.Text),
+                          sa.column('section_text_id', sa.Integer))
+section_texts = sa.table('section_texts',
+                         sa.column('index', sa.Integer),
+                         sa.column('hash', sa.String),
+                         sa.column('text', sa.Text))
+
+
+def upgrade():
+    op.create_table('section_texts',
+                    sa.Column('index', sa.Integer(), nullable=False),
+                    sa.Column('hash', sa.String(length=64), nullable=False),
+                    sa.Column('text', sa.Text(), nullable=False),
+                    sa.PrimaryKeyConstraint('index'),
+                    sa.UniqueConstraint('hash'))
+    op.add_column('transcriptions', sa.Column('section_text_id', sa.Integer(),
+                                              nullable=True))
+
+    bind = op.get_bind()
+    texts = bind.execute(sa.select([transcriptions.c.text]).distinct())
+    while True:
+        batch = texts.fetchmany(BATCH)
+        if not batch:
+            break
+        op.bulk_insert(section_texts, [
+            {'hash': hashlib.sha256(text.encode('utf-8')).hexdigest(),
+             'text': text} for text, in batch])
+
+    # link each row to its text by value; Postgres hash joins the tables,
+    # SQLite looks each text up in a temporary index
+    postgres = bind.dialect.name == 'postgresql'
+    if postgres:
+        link = transcriptions.update().where(
+            section_texts.c.text == transcriptions.c.text).values(
+            section_text_id=section_texts.c.index)
+    else:
+        op.create_index('tmp_section_texts_text', 'section_texts', ['text'])
+        link = transcriptions.update().values(section_text_id=sa.select(
+            [section_texts.c.index]).where(
+            section_texts.c.text == transcriptions.c.text).as_scalar())
+    op.execute(link)
+    if not postgres:
+        op.drop_index('tmp_section_texts_text', 'section_texts')
+
+    with op.batch_alter_table('transcriptions') as batch_op:
+        batch_op.alter_column('section_text_id', existing_type=sa.Integer(),
+                              nullable=False)
+        batch_op.create_foreign_key('fk_transcriptions_section_text_id',
+                                    'section_texts', ['section_text_id'],
+                                    ['index'])
+        batch_op.create_index('ix_transcriptions_section_text_id',
+                              ['section_text_id'])
+        batch_op.drop_column('text')
+
+
+def downgrade():
+    op.add_column('transcriptions', sa.Column('text', sa.Text(),
+                                              nullable=True))
+    op.execute(transcriptions.update().values(text=sa.select(
+        [section_texts.c.text]).where(
+        section_texts.c.index == transcriptions.c.section_text_id
+    ).as_scalar()))
+    with op.batch_alter_table('transcriptions') as batch_op:
+        batch_op.alter_column('text', existing_type=sa.Text(),
+                              nullable=False)
+        batch_op.drop_index('ix_transcriptions_section_text_id')
+        batch_op.drop_constraint('fk_transcriptions_section_text_id',
+                                 type_='foreignkey')
+        batch_op.drop_column('section_text_id')
+    op.drop_table('section_texts')
@@ -0,0 +1,82 @@
+"""baseline schema, as created by db.create_all() before migrations
+
+Databases created that way already have these tables: mark them with
+`flask db stamp 5d2c7a1e9f03`, then run `flask db upgrade`.
+
+Revision ID: 5d2c7a1e9f03
+Revises:
+Create Date: 2019-05-20 10:12:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2c7a1e9f03'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.supports_sequences:
+        op.execute(sa.schema.CreateSequence(sa.Sequence('id')))
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), sa.Sequence('id'), nullable=False),
+        sa.Column('username', sa.String(length=80), nullable=False),
+        sa.Column('password_hash', sa.String(length=120), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('username'))
+    op.create_table(
+        'verification',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('code', sa.String(length=120), nullable=False),
+        sa.PrimaryKeyConstraint('id'))
+    op.create_table(
+        'transcriptions',
+        sa.Column('index', sa.Integer(), nullable=False),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('mrn', sa.Integer(), nullable=False),
+        sa.Column('transcription_id', sa.String(length=80), nullable=False),
+        sa.Column('text', sa.Text(), nullable=False),
+        sa.Column('entity', sa.Text(), nullable=True),
+        sa.Column('start', sa.Integer(), nullable=True),
+        sa.Column('end', sa.Integer(), nullable=True),
+        sa.Column('label', sa.String(length=100), nullable=True),
+        sa.Column('subject_id', sa.String(length=200), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('index'))
+    op.create_table(
+        'queue',
+        sa.Column('index', sa.Integer(), nullable=False),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('mrn', sa.Integer(), nullable=False),
+        sa.Column('transcription_id', sa.String(length=80), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.Column('filename', sa.String(length=80), nullable=False),
+        sa.Column('content', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('index'))
+    op.create_table(
+        'history',
+        sa.Column('index', sa.Integer(), nullable=False),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('mrn', sa.Integer(), nullable=False),
+        sa.Column('transcription_id', sa.String(length=80), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.Column('filename', sa.String(length=80), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('diseases', sa.Text(), nullable=False),
+        sa.Column('meds', sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint('index'))
+
+
+def downgrade():
+    op.drop_table('history')
+    op.drop_table('queue')
+    op.drop_table('transcriptions')
+    op.drop_table('verification')
+    op.drop_table('users')
+    if op.get_bind().dialect.supports_sequences:
+        op.execute(sa.schema.DropSequence(sa.Sequence('id')))
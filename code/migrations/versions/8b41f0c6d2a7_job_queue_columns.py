@@ -0,0 +1,42 @@
+"""job state and profiling flag on queue
+
+Revision ID: 8b41f0c6d2a7
+Revises: 5d2c7a1e9f03
+Create Date: 2019-05-20 10:31:07.524913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b41f0c6d2a7'
+down_revision = '5d2c7a1e9f03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('queue', sa.Column('status', sa.String(length=20),
+                                     server_default='pending',
+                                     nullable=False))
+    op.add_column('queue', sa.Column('worker', sa.String(length=200),
+                                     nullable=True))
+    op.add_column('queue', sa.Column('claimed_at', sa.DateTime(),
+                                     nullable=True))
+    op.add_column('queue', sa.Column('attempts', sa.Integer(),
+                                     server_default='0', nullable=False))
+    op.add_column('queue', sa.Column('profile', sa.Boolean(),
+                                     server_default=sa.false(),
+                                     nullable=False))
+    # uploads processed before the job queue existed
+    op.execute("UPDATE queue SET status = 'done' WHERE content IS NOT NULL")
+
+
+def downgrade():
+    with op.batch_alter_table('queue') as batch_op:
+        batch_op.drop_column('profile')
+        batch_op.drop_column('attempts')
+        batch_op.drop_column('claimed_at')
+        batch_op.drop_column('worker')
+        batch_op.drop_column('status')
@@ -0,0 +1,42 @@
+"""indexes for the hot lookups in routes, jobs and retrain
+
+Revision ID: c3e9a4b7f158
+Revises: 8b41f0c6d2a7
+Create Date: 2019-05-20 11:02:55.301417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e9a4b7f158'
+down_revision = '8b41f0c6d2a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_queue_transcription_id', 'queue',
+                    ['transcription_id'])
+    op.create_index('ix_queue_id_timestamp', 'queue', ['id', 'timestamp'])
+    op.create_index('ix_queue_status_timestamp', 'queue',
+                    ['status', 'timestamp'])
+    op.create_index('ix_history_transcription_id', 'history',
+                    ['transcription_id'])
+    op.create_index('ix_history_id_timestamp', 'history',
+                    ['id', 'timestamp'])
+    op.create_index('ix_history_id_mrn_timestamp', 'history',
+                    ['id', 'mrn', 'timestamp'])
+    op.create_index('ix_transcriptions_timestamp', 'transcriptions',
+                    ['timestamp'])
+
+
+def downgrade():
+    op.drop_index('ix_transcriptions_timestamp', 'transcriptions')
+    op.drop_index('ix_history_id_mrn_timestamp', 'history')
+    op.drop_index('ix_history_id_timestamp', 'history')
+    op.drop_index('ix_history_transcription_id', 'history')
+    op.drop_index('ix_queue_status_timestamp', 'queue')
+    op.drop_index('ix_queue_id_timestamp', 'queue')
+    op.drop_index('ix_queue_transcription_id', 'queue')
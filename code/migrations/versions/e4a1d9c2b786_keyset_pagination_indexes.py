@@ -0,0 +1,39 @@
+"""extend the physician listing indexes with index for keyset pagination
+
+Revision ID: e4a1d9c2b786
+Revises: c3e9a4b7f158
+Create Date: 2019-05-21 09:47:13.802265
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a1d9c2b786'
+down_revision = 'c3e9a4b7f158'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_queue_id_timestamp_index', 'queue',
+                    ['id', 'timestamp', 'index'])
+    op.create_index('ix_history_id_timestamp_index', 'history',
+                    ['id', 'timestamp', 'index'])
+    op.create_index('ix_history_id_mrn_timestamp_index', 'history',
+                    ['id', 'mrn', 'timestamp', 'index'])
+    op.drop_index('ix_queue_id_timestamp', 'queue')
+    op.drop_index('ix_history_id_timestamp', 'history')
+    op.drop_index('ix_history_id_mrn_timestamp', 'history')
+
+
+def downgrade():
+    op.create_index('ix_history_id_mrn_timestamp', 'history',
+                    ['id', 'mrn', 'timestamp'])
+    op.create_index('ix_history_id_timestamp', 'history',
+                    ['id', 'timestamp'])
+    op.create_index('ix_queue_id_timestamp', 'queue', ['id', 'timestamp'])
+    op.drop_index('ix_history_id_mrn_timestamp_index', 'history')
+    op.drop_index('ix_history_id_timestamp_index', 'history')
+    op.drop_index('ix_queue_id_timestamp_index', 'queue')
@@ -0,0 +1,47 @@
+"""store extraction results and reviews as native JSON
+
+Revision ID: f7b2c85d1e40
+Revises: e4a1d9c2b786
+Create Date: 2019-05-28 14:12:40.118734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7b2c85d1e40'
+down_revision = 'e4a1d9c2b786'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [('queue', 'content', True), ('history', 'content', False),
+           ('history', 'diseases', False), ('history', 'meds', False)]
+
+
+def upgrade():
+    # SQLite keeps JSON as text, so only Postgres needs the rows converted
+    if op.get_bind().dialect.name == 'postgresql':
+        for table, column, nullable in COLUMNS:
+            op.alter_column(table, column, type_=postgresql.JSONB(),
+                            existing_type=sa.Text(),
+                            existing_nullable=nullable,
+                            postgresql_using='{}::jsonb'.format(column))
+    op.create_index('ix_history_diseases', 'history', ['diseases'],
+                    postgresql_using='gin',
+                    postgresql_ops={'diseases': 'jsonb_path_ops'})
+    op.create_index('ix_history_meds', 'history', ['meds'],
+                    postgresql_using='gin',
+                    postgresql_ops={'meds': 'jsonb_path_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_history_meds', 'history')
+    op.drop_index('ix_history_diseases', 'history')
+    if op.get_bind().dialect.name == 'postgresql':
+        for table, column, nullable in COLUMNS:
+            op.alter_column(table, column, type_=sa.Text(),
+                            existing_type=postgresql.JSONB(),
+                            existing_nullable=nullable,
+                            postgresql_using='{}::text'.format(column))
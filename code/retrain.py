@@ -1,7 +1,9 @@
 import paramiko
 from user_definition import *
 from deploy import ssh_client, ssh_connection, deploy_model
+from app import db
 from app.classes import Data
+from app.model_registry import ModelRegistry
 import spacy
 import os
 from app.nlp import train, load_model
@@ -9,7 +11,6 @@ from datetime import datetime, timedelta
 import pytz
 import tarfile
 import boto3
-from app import spacy_model
 
 """
 Work Flow:
@@ -19,29 +20,12 @@ Step Two: Pull down training data from DB from past week.
 Step Three: Make sure training data is formatted correctly for SpaCy.
 Step Four: Train model on new data.
 Step Five: Push new model weights to S3.
-Step Six: Kill app.
-Step Seven: Delete old weights?
-Step Seven: Re-Deploy app.
-
-Notes:
-    - Do not need to establish ssh connection if file is already present
-    on server?
-        - Figure out how to run bash commands from script to close screen
-        without ssh connection
+Step Six: The running app picks up the new version from ../models and
+          swaps it in without a restart (see app.model_registry), so it is
+          neither shut down nor redeployed.
 """
 
 
-def shut_down_app():
-    """
-    Shut down app currently running.
-
-    :param ssh: SSH connection object
-    :return: None
-    """
-    screen_command = "screen -S test -X quit"
-    os.system(screen_command)
-
-
 def get_dir():
     """
     Load current weights.
@@ -51,9 +35,8 @@ def get_dir():
     """
     par_dir = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
     par_dir += "/models"
-    for root, dirs, files in os.walk(par_dir):
-        model_dir = "{}/{}".format(par_dir, dirs[0])
-        break
+    # the newest version, never a half-written .tmp staging directory
+    model_dir = ModelRegistry(par_dir).latest_dir()
     return model_dir, par_dir
 
 
@@ -66,7 +49,11 @@ def get_data():
     today_utc = pytz.utc.localize(datetime.utcnow())
     today_pst = today_utc.astimezone(pytz.timezone("America/Los_Angeles"))
     one_week_ago = today_pst - timedelta(days=7)
-    raw_data = Data.query.filter(Data.timestamp > one_week_ago).all()
+    # section texts are stored once; join them in rather than one query
+    # per row
+    raw_data = Data.query.join(Data.section_text) \
+        .options(db.contains_eager(Data.section_text)) \
+        .filter(Data.timestamp > one_week_ago).all()
     train_data = [row.__repr__().split("/col/") for row in raw_data]
     return train_data
 
@@ -142,10 +129,6 @@ def push_weights(zip_file):
                    ExtraArgs={'ACL': 'public-read'})
 
 
-def redeploy():
-    os.system("bash flask.sh")
-
-
 def main():
     raw_data = get_data()
     training_data = format_data(raw_data)
@@ -154,8 +137,6 @@ def main():
     zipped = to_zip(path)
     to_s3 = str(zipped).split("/")[-1]
     push_weights(to_s3)
-    shut_down_app()
-    redeploy()
 
 
 if __name__ == "__main__":
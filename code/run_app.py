@@ -1 +1,17 @@
-from app import application
+"""Single-process server: python run_app.py
+
+Warms the app up in the background and serves it on FLASK_RUN_HOST and
+FLASK_RUN_PORT from .flaskenv. The `flask` command loads `app` instead,
+so CLI commands (`flask db upgrade`, `flask check-query-plans`) never
+start the scheduler or the job workers."""
+import os
+
+from flask.cli import load_dotenv
+
+from app import application, warm_up
+
+if __name__ == '__main__':
+    load_dotenv()
+    warm_up(background=True)
+    application.run(host=os.environ.get('FLASK_RUN_HOST', '127.0.0.1'),
+                    port=int(os.environ.get('FLASK_RUN_PORT', 5000)))
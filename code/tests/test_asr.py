@@ -0,0 +1,43 @@
+from concurrent.futures import TimeoutError
+import threading
+import time
+
+import pytest
+
+from app.asr import ASRBackend
+
+
+class SlowBackend(ASRBackend):
+    def __init__(self, seconds, **kwargs):
+        super(SlowBackend, self).__init__(**kwargs)
+        self.seconds = seconds
+
+    def recognize(self, source):
+        time.sleep(self.seconds)
+        return source
+
+
+def test_timeout_does_not_count_time_queued():
+    backend = SlowBackend(0.2, max_concurrency=1, timeout=0.3)
+    results = []
+    threads = [threading.Thread(
+        target=lambda i=i: results.append(backend.transcribe(str(i))))
+        for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # the last call waited 0.4s for the single slot, longer than timeout
+    assert sorted(results) == ['0', '1', '2']
+
+
+def test_timeout_of_a_running_call():
+    backend = SlowBackend(0.3, timeout=0.05)
+    with pytest.raises(TimeoutError):
+        backend.transcribe('slow')
+
+
+def test_segments_joined_in_order():
+    backend = SlowBackend(0.01, max_concurrency=2, timeout=1)
+    assert backend.transcribe_segments(
+        iter(['a', 'b', 'c', 'd', 'e']), max_pending=2) == "a b c d e"
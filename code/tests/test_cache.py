@@ -0,0 +1,72 @@
+import os
+import time
+
+import pytest
+from prometheus_client import REGISTRY
+
+pytest.importorskip('spacy')
+
+from app.cache import DiskBackend, MemoryBackend, ResultCache
+
+
+class Model(object):
+    def __init__(self, version):
+        self.meta = {'name': 'test', 'version': version}
+
+
+def files(directory):
+    return [name for _, _, names in os.walk(directory)
+            for name in names if name.endswith('.json')]
+
+
+def test_disk_bound_covers_entries_of_other_processes(tmpdir):
+    # two caches on one directory stand in for two gunicorn workers
+    model = Model('0.1.0')
+    first = ResultCache(DiskBackend(str(tmpdir)), max_entries=4)
+    second = ResultCache(DiskBackend(str(tmpdir)), max_entries=4)
+    for i in range(3):
+        first.set(model, 'first {}'.format(i), {'i': i})
+        time.sleep(0.01)
+    for i in range(3):
+        second.set(model, 'second {}'.format(i), {'i': i})
+        time.sleep(0.01)
+    assert len(files(str(tmpdir))) == 4
+    assert second.evictions == 2
+    assert first.get(model, 'first 0') is None
+    assert first.get(model, 'first 2') == {'i': 2}
+    assert first.get(model, 'second 2') == {'i': 2}
+
+
+def test_new_version_removes_old_entries_of_other_processes(tmpdir):
+    old, new, newer = Model('0.1.0'), Model('0.2.0'), Model('0.3.0')
+    first = ResultCache(DiskBackend(str(tmpdir)))
+    second = ResultCache(DiskBackend(str(tmpdir)))
+    first.set(old, 'note', {'version': 1})
+    second.set(old, 'note', {'version': 1})
+    second.set(new, 'note', {'version': 2})
+    # the previous version stays for jobs finishing on it
+    assert first.get(old, 'note') == {'version': 1}
+    assert len(files(str(tmpdir))) == 2
+    # first moves from 0.1.0 to 0.3.0: 0.2.0 is neither
+    first.set(newer, 'note', {'version': 3})
+    assert len(files(str(tmpdir))) == 2
+    assert second.get(new, 'note') is None
+    assert first.get(newer, 'note') == {'version': 3}
+
+
+def test_counters_reach_metrics():
+    def sample(name):
+        return REGISTRY.get_sample_value(
+            'armr_result_cache_{}_total'.format(name)) or 0
+
+    before = {name: sample(name)
+              for name in ('hits', 'misses', 'evictions')}
+    model = Model('0.1.0')
+    cache = ResultCache(MemoryBackend(), max_entries=1)
+    assert cache.get(model, 'a') is None
+    cache.set(model, 'a', {})
+    cache.set(model, 'b', {})
+    assert cache.get(model, 'b') == {}
+    assert {name: sample(name) - count
+            for name, count in before.items()} == \
+        {'hits': 1, 'misses': 1, 'evictions': 1}
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from app.chunking import iter_chunks
+
+FILLER = ("the patient was seen today", "vitals were stable", "no acute "
+          "distress", "follow up in two weeks", "atrial fibrillation",
+          "hypertension")
+
+
+def transcript(rng, sentences):
+    return " ".join(
+        " ".join(rng.choice(FILLER) for _ in range(rng.randint(1, 4))) +
+        rng.choice(('.', '!', ',', '')) for _ in range(sentences))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_every_character_has_one_owning_chunk(seed):
+    rng = random.Random(seed)
+    text = transcript(rng, rng.randint(0, 80))
+    start = rng.randint(0, len(text))
+    end = rng.randint(start, len(text))
+    max_chars = rng.choice((40, 100, 300))
+    chunks = list(iter_chunks(text, start, end, max_chars, overlap=50))
+    owners = [0] * len(text)
+    for chunk_start, chunk_end, own_start, own_end in chunks:
+        assert start <= chunk_start <= own_start <= own_end <= chunk_end
+        assert chunk_end - chunk_start <= max_chars
+        for pos in range(own_start, own_end):
+            owners[pos] += 1
+    assert owners[start:end] == [1] * (end - start)
+    assert chunks[0][2] == start and chunks[-1][3] == end
+
+
+def test_short_and_empty_ranges_are_one_chunk():
+    text = "Allergies: none."
+    assert list(iter_chunks(text, 4, 4)) == [(4, 4, 4, 4)]
+    assert list(iter_chunks(text)) == [(0, 16, 0, 16)]
+
+
+def test_chunks_do_not_split_words():
+    text = "word " * 200
+    for chunk_start, chunk_end, _, _ in iter_chunks(text, max_chars=64,
+                                                    overlap=16):
+        assert chunk_start == 0 or text[chunk_start - 1] == ' '
+        assert chunk_end == len(text) or text[chunk_end - 1] == ' '
+
+
+def test_entity_straddling_a_seam_is_reported_once(stand_in_model):
+    from app.nlp import stream_entities
+
+    term = 'atrial fibrillation'
+    text = "Impression: " + transcript(random.Random(1), 60)
+    starts = []
+    found = text.find(term)
+    while found != -1:
+        starts.append(found)
+        found = text.find(term, found + 1)
+    chunks = list(iter_chunks(text, 12, len(text), 200, 60))
+    # at least one occurrence is cut off at the end of a chunk
+    assert any(start < cut < start + len(term)
+               for start in starts for _, cut, _, _ in chunks[:-1])
+    reported = [(start, end) for _, _, kind, start, end, record
+                in stream_entities(stand_in_model, text, 200, 60)
+                if record['name'] == term]
+    assert reported == [(start, start + len(term)) for start in starts]
+
+
+def test_long_note_matches_single_pass(stand_in_model):
+    from app.nlp import prepare_long_note, prepare_note
+
+    rng = random.Random(2)
+    text = ("History of present illness: " + transcript(rng, 30) +
+            " Medications prior to admission: aspirin 81 mg daily."
+            " Allergies Impression: " + transcript(rng, 30))
+    expected = prepare_note(stand_in_model, text)
+    assert expected['allergies']['text'] == ""
+    assert prepare_long_note(stand_in_model, text, 150, 50) == expected
+    assert prepare_long_note(stand_in_model, text) == expected
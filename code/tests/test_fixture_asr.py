@@ -0,0 +1,42 @@
+import wave
+
+import numpy
+import pytest
+
+from app import audio
+from app.asr import FixtureBackend
+
+
+def write_recording(tmpdir, seconds=45, rate=8000, text="chest pain"):
+    """Stereo tone bursts between silences, with its fixture transcript"""
+    t = numpy.arange(int(seconds * rate)) / float(rate)
+    tone = 0.3 * numpy.sin(2 * numpy.pi * 220 * t) * (t % 2 < 1)
+    pcm = (numpy.repeat(tone[:, None], 2, axis=1) * 32767).astype('<i2')
+    path = str(tmpdir.join('visit.wav'))
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm.tobytes())
+    tmpdir.join('visit.txt').write(text)
+    return path
+
+
+def test_fixture_of_a_preprocessed_segmented_recording(tmpdir):
+    path = write_recording(tmpdir)
+    backend = FixtureBackend(default="missing")
+    preprocessor = audio.Preprocessor()
+    segments = audio.iter_segments(path, 30, preprocess=preprocessor)
+    assert backend.transcribe_segments(segments, source=path) == \
+        "chest pain"
+    assert preprocessor.removed_seconds > 0
+
+
+def test_transcribe_with_preprocessing(tmpdir):
+    pytest.importorskip('spacy')
+    from app import application, nlp
+
+    path = write_recording(tmpdir)
+    assert application.config['AUDIO_PREPROCESS']
+    assert application.config['ASR_SEGMENT_SECONDS'] < 45
+    assert nlp.transcribe(path) == "chest pain"
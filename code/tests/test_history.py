@@ -0,0 +1,32 @@
+from datetime import datetime
+
+import pytest
+
+from app import db
+from app.classes import History
+
+
+def add_report(index, diseases, meds):
+    db.session.add(History(1, 1234567, 'note-{}'.format(index),
+                           datetime(2019, 4, 1), 'note.wav', {},
+                           diseases, meds))
+
+
+def test_having_entity(database):
+    add_report(1, {'impression': ['angina']},
+               {'medications prior to admission': ['aspirin']})
+    add_report(2, {'impression': ['hypertension', 'angina']}, {})
+    add_report(3, {'allergies': ['angina']}, {'impression': ['aspirin']})
+    db.session.commit()
+
+    def found(column, section, entity):
+        query = History.having_entity(column, section, entity)
+        return sorted(row.transcription_id for row in query)
+
+    assert found('diseases', 'impression', 'angina') == ['note-1', 'note-2']
+    assert found('diseases', 'impression', 'hypertension') == ['note-2']
+    assert found('meds', 'impression', 'aspirin') == ['note-3']
+    assert found('meds', 'allergies', 'aspirin') == []
+    assert found('diseases', 'impression', 'angin') == []
+    with pytest.raises(ValueError):
+        History.having_entity('content', 'impression', 'angina')
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+import uuid
+
+import pytest
+
+from app import application, db, jobs
+from app.classes import Queue
+
+
+@pytest.fixture(autouse=True)
+def no_held_claims():
+    jobs.forget(list(jobs._held))
+
+
+def queue_upload(minutes_ago=0):
+    upload = Queue(id=1, mrn=1234567, transcription_id=str(uuid.uuid4()),
+                   timestamp=datetime.utcnow() + jobs.TIMESTAMP_OFFSET -
+                   timedelta(minutes=minutes_ago),
+                   filename='visit.wav')
+    db.session.add(upload)
+    db.session.commit()
+    return upload.index
+
+
+def state(index):
+    db.session.expire_all()
+    upload = Queue.query.get(index)
+    return upload.status, upload.worker, upload.attempts
+
+
+def abandon(index):
+    """Age a claim past JOB_CLAIM_TIMEOUT, as if its worker had hung"""
+    timeout = application.config['JOB_CLAIM_TIMEOUT']
+    Queue.query.filter_by(index=index).update(
+        {'claimed_at': datetime.utcnow() - timedelta(seconds=timeout + 1)})
+    db.session.commit()
+
+
+def test_claims_oldest_first_and_only_once(database):
+    newer = queue_upload()
+    older = queue_upload(minutes_ago=5)
+    assert [u.index for u in jobs.claim('a', limit=1)] == [older]
+    assert [u.index for u in jobs.claim('b', limit=5)] == [newer]
+    assert jobs.claim('c', limit=5) == []
+
+
+def test_release_returns_upload_then_fails_it(database):
+    index = queue_upload()
+    for attempt in range(1, 4):
+        jobs.claim('a')
+        assert jobs.release([index], 'a') == 1
+    assert state(index) == (jobs.FAILED, None, 3)
+
+
+def test_stale_claim_takeover(database):
+    index = queue_upload()
+    jobs.claim('a')
+    assert jobs.claim('b') == []
+    abandon(index)
+    assert [u.index for u in jobs.claim('b')] == [index]
+
+    # the worker that lost the claim can no longer release it
+    assert jobs.release([index], 'a') == 0
+    assert state(index) == (jobs.CLAIMED, 'b', 0)
+
+    # nor undo the result of the worker that took it over
+    Queue.query.filter_by(index=index).update({'status': jobs.DONE})
+    db.session.commit()
+    assert jobs.release([index], 'a') == 0
+    assert jobs.release([index], 'b') == 0
+    assert state(index) == (jobs.DONE, 'b', 0)
+
+
+def test_finish_only_while_held(database):
+    index = queue_upload()
+    jobs.claim('a')
+    abandon(index)
+    jobs.claim('b')
+    assert not jobs.finish(index, 'a', {'content': {'from': 'a'}})
+    assert jobs.finish(index, 'b', {'content': {'from': 'b'}})
+    db.session.commit()
+    assert state(index) == (jobs.DONE, 'b', 0)
+    assert Queue.with_payload().get(index).content == {'from': 'b'}
+
+
+def test_heartbeat_keeps_claims_in_flight(database):
+    index = queue_upload()
+    jobs.claim('a')
+    abandon(index)
+    assert jobs.heartbeat() >= 1
+    assert jobs.claim('b') == []
+    jobs.forget([index])
+    abandon(index)
+    assert jobs.heartbeat() == 0
+    assert [u.index for u in jobs.claim('b')] == [index]
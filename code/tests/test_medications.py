@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+spacy = pytest.importorskip('spacy')
+
+from spacy.tokens import Doc, Span
+
+from app.matchers import build_medication_matcher
+from app.medications import medication_bounds
+from app.nlp import medication_spans
+
+WORDS = ('aspirin', 'metoprolol', '81', 'twenty', '2.5', 'mg', 'MG', 'mcg',
+         'daily', 'orally', '.', ',', 'and', 'with', 'pain')
+DRUGS = ('aspirin', 'metoprolol', 'beta')
+
+
+@pytest.fixture(scope='module')
+def model():
+    return spacy.blank('en')
+
+
+@pytest.fixture(scope='module')
+def vocab(model):
+    return model.vocab
+
+
+@pytest.fixture(scope='module')
+def matcher(model):
+    return build_medication_matcher(model)
+
+
+def make_doc(vocab, words, ents):
+    doc = Doc(vocab, words=list(words))
+    doc.ents = [Span(doc, start, end, label=label)
+                for label, start, end in ents]
+    return doc
+
+
+def matcher_bounds(matcher, doc):
+    """What section_entities(vectorised=False) extracts"""
+    return [(span.start, span.end)
+            for span in medication_spans(doc, matcher(doc))]
+
+
+@pytest.mark.parametrize('words, ents, expected', [
+    ([], [], []),
+    (['aspirin'], [('CHEMICAL', 0, 1)], [(0, 1)]),
+    (['aspirin', '81', 'mg'], [('CHEMICAL', 0, 1)], [(0, 3)]),
+    (['aspirin', '81', 'mg', 'daily'], [('CHEMICAL', 0, 1)], [(0, 4)]),
+    (['aspirin', '81', 'mcg', 'daily'], [('CHEMICAL', 0, 1)], [(0, 1)]),
+    (['aspirin', 'daily', '81', 'mg'], [('CHEMICAL', 0, 1)], [(0, 1)]),
+    (['pain', '81', 'mg', 'daily'], [('DISEASE', 0, 1)], []),
+    # every token of a multi-token entity starts a mention
+    (['beta', 'blocker', '5', 'mg'], [('CHEMICAL', 0, 2)],
+     [(0, 1), (1, 4)]),
+    (['aspirin', 'metoprolol', '25', 'MG', '.'],
+     [('CHEMICAL', 0, 1), ('CHEMICAL', 1, 2)], [(0, 1), (1, 5)]),
+])
+def test_table(vocab, matcher, words, ents, expected):
+    doc = make_doc(vocab, words, ents)
+    assert medication_bounds(doc) == expected
+    assert matcher_bounds(matcher, doc) == expected
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_matches_matcher_on_random_docs(vocab, matcher, seed):
+    rng = random.Random(seed)
+    words, ents = [], []
+    size = rng.randint(0, 25)
+    while len(words) < size:
+        if rng.random() < 0.3:
+            drug = rng.choice(DRUGS)
+            words.extend(['beta', 'blocker'] if drug == 'beta' else [drug])
+            length = 2 if drug == 'beta' else 1
+            ents.append((rng.choice(('CHEMICAL', 'CHEMICAL', 'DISEASE')),
+                         len(words) - length, len(words)))
+        else:
+            words.append(rng.choice(WORDS))
+    doc = make_doc(vocab, words, ents)
+    assert medication_bounds(doc) == matcher_bounds(matcher, doc), words
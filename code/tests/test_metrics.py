@@ -0,0 +1,41 @@
+import multiprocessing
+
+import pytest
+
+from app import metrics
+
+
+def sample(stage, name='armr_stage_seconds_count'):
+    for family in metrics.STAGE_SECONDS.collect():
+        for sample in family.samples:
+            if sample[0] == name and sample[1] == {'stage': stage}:
+                return sample[2]
+    return 0
+
+
+def observe_in_child(_):
+    with metrics.collected() as observations:
+        with metrics.timed('categorize_note'):
+            pass
+        metrics.observe('parse_entities', 0.5)
+    return observations
+
+
+def test_timings_of_forked_processes_recorded_by_parent():
+    before = sample('categorize_note'), sample('parse_entities')
+    context = multiprocessing.get_context('fork')
+    with context.Pool(2) as pool:
+        for observations in pool.map(observe_in_child, range(3)):
+            metrics.replay(observations)
+    assert sample('categorize_note') == before[0] + 3
+    assert sample('parse_entities') == before[1] + 3
+
+
+def test_collected_observations_are_not_recorded_directly():
+    before = sample('asr')
+    with metrics.collected() as observations:
+        with pytest.raises(ValueError):
+            with metrics.timed('asr'):
+                raise ValueError
+    assert sample('asr') == before
+    assert observations[0][0] == 'asr' and observations[0][2]
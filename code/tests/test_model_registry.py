@@ -0,0 +1,19 @@
+import os
+
+from app.model_registry import ModelRegistry, version_key
+
+
+def test_version_key():
+    assert version_key('en_ner_bc5cdr_md-0.10.0') == (0, 10, 0)
+    assert version_key('0.2.0') == (0, 2, 0)
+    assert version_key('en_ner_bc5cdr_md-0.11.0.tmp') is None
+    assert version_key('README.md') is None
+
+
+def test_latest_dir_skips_staging_directories(tmpdir):
+    for name in ('en_ner_bc5cdr_md-0.1.0', 'en_ner_bc5cdr_md-0.10.0',
+                 'en_ner_bc5cdr_md-0.11.0.tmp'):
+        tmpdir.mkdir(name)
+    tmpdir.join('en_ner_bc5cdr_md-0.12.0').write('not a directory')
+    latest = ModelRegistry(str(tmpdir)).latest_dir()
+    assert latest == os.path.join(str(tmpdir), 'en_ner_bc5cdr_md-0.10.0')
@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip('spacy')
+
+from app import nlp
+
+
+class Registry(object):
+    def __init__(self):
+        self.model = object()
+
+    def current(self):
+        return self.model
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = Registry()
+    monkeypatch.setattr(nlp, 'model_registry', registry)
+    return registry
+
+
+def running(pool):
+    try:
+        return pool.map(abs, [-1]) == [1]
+    except ValueError:  # closed
+        return False
+
+
+def test_swap_joins_the_retired_pool_after_its_last_batch(registry):
+    notes = nlp.NoteProcesses(2)
+    notes.start()
+    with notes.checkout() as (old_model, old_pool):
+        assert old_model is registry.model
+        registry.model = object()
+        with notes.checkout() as (model, pool):
+            assert model is registry.model and pool is not old_pool
+        # a batch still runs on the old pool
+        assert running(old_pool)
+    assert not running(old_pool)
+    with notes.checkout() as (_, current):
+        assert current is pool and running(pool)
+    registry.model = object()
+    notes.start()
+    assert not running(pool)
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+import uuid
+
+from app import db
+from app.classes import Queue
+from app.pagination import decode_cursor, encode_cursor, paginate
+
+
+def queue_uploads(count, physician=1):
+    start = datetime(2019, 5, 1, 9, 0)
+    for i in range(count):
+        # pairs of uploads share a timestamp, so the index breaks ties
+        db.session.add(Queue(id=physician, mrn=1000000 + i,
+                             transcription_id=str(uuid.uuid4()),
+                             timestamp=start + timedelta(minutes=i // 2),
+                             filename='{}.wav'.format(i)))
+    db.session.commit()
+
+
+def indexes(page):
+    return [row.index for row in page]
+
+
+def newest_first(physician=1):
+    return indexes(Queue.query.filter_by(id=physician).order_by(
+        Queue.timestamp.desc(), Queue.index.desc()))
+
+
+def test_cursor_round_trip(database):
+    queue_uploads(1)
+    row = Queue.query.one()
+    assert decode_cursor(encode_cursor(row)) == (row.timestamp, row.index)
+    assert decode_cursor('not a cursor') is None
+
+
+def test_pages_cover_every_row_once_in_both_directions(database):
+    queue_uploads(7)
+    queue_uploads(3, physician=2)
+    query = Queue.query.filter_by(id=1)
+    expected = newest_first()
+
+    pages = [paginate(query, Queue, limit=3)]
+    assert pages[0].newer is None
+    while pages[-1].older:
+        pages.append(paginate(query, Queue, after=pages[-1].older, limit=3))
+    assert [indexes(page) for page in pages] == \
+        [expected[0:3], expected[3:6], expected[6:7]]
+
+    back = paginate(query, Queue, before=pages[-1].newer, limit=3)
+    assert indexes(back) == expected[3:6]
+    back = paginate(query, Queue, before=back.newer, limit=3)
+    assert indexes(back) == expected[0:3]
+    assert back.newer is None
+
+
+def test_malformed_cursor_gives_the_first_page(database):
+    queue_uploads(4)
+    page = paginate(Queue.query, Queue, after='garbage', limit=2)
+    assert indexes(page) == newest_first()[:2]
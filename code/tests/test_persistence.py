@@ -0,0 +1,72 @@
+from datetime import datetime
+import uuid
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.classes import Data, History, Queue, SectionText
+from app.persistence import entity_offsets, save_review
+
+SECTION = "started aspirin 81 mg and metoprolol for atrial fibrillation"
+
+
+def queue_upload():
+    upload = Queue(id=1, mrn=1234567, transcription_id=str(uuid.uuid4()),
+                   timestamp=datetime(2019, 5, 1), filename='visit.wav')
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+
+def review(upload, reviewed):
+    content = {'impression': {'text': SECTION, 'diseases': [],
+                              'medications': []}}
+    return save_review(upload, reviewed, 1, datetime(2019, 5, 1),
+                       datetime(2019, 5, 1), {'impression': ['afib']},
+                       {'impression': ['aspirin']}, content)
+
+
+def test_entity_offsets():
+    assert entity_offsets([
+        ('1', SECTION, 'medication', 'aspirin 81 mg'),
+        ('1', SECTION, 'disease', 'atrial fibrillation'),
+        ('1', SECTION, 'disease', 'not there')]) == [
+        ('1', SECTION, 'aspirin', 8, 15, 'medication'),
+        ('1', SECTION, 'atrial fibrillation', 41, 60, 'disease'),
+        ('1', 'not there', 'not there', 0, 9, 'disease')]
+
+
+def test_save_review_stores_each_section_text_once(database):
+    reviewed = [('1', SECTION, 'medication', 'aspirin 81 mg'),
+                ('1', SECTION, 'medication', 'metoprolol'),
+                ('1', SECTION, 'disease', 'atrial fibrillation')]
+    first, second = queue_upload(), queue_upload()
+    assert review(first, reviewed) == 3
+    assert review(second, reviewed[:1]) == 1
+
+    assert Data.query.count() == 4
+    assert SectionText.query.count() == 1
+    assert {row.text for row in Data.query} == {SECTION}
+    assert Queue.query.count() == 0
+    history = History.with_payload().filter_by(
+        transcription_id=first.transcription_id).one()
+    assert history.diseases == {'impression': ['afib']}
+    assert History.report(1, first.transcription_id, ['impression']) == (
+        {'impression': {'text': SECTION}}, {'impression': ['afib']},
+        {'impression': ['aspirin']})
+    # another physician's report, or an unknown one
+    assert History.report(2, first.transcription_id, ['impression']) is None
+    assert History.report(1, 'unknown', ['impression']) is None
+
+
+def test_save_review_rolls_back_on_error(database):
+    upload = queue_upload()
+    # subject_id is required: the transcriptions insert fails after the
+    # section text was written
+    reviewed = [(None, SECTION, 'disease', 'atrial fibrillation')]
+    with pytest.raises(IntegrityError):
+        review(upload, reviewed)
+    assert SectionText.query.count() == 0
+    assert History.query.count() == 0
+    assert Queue.query.count() == 1
@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip('spacy')
+
+from app.matchers import TERMINOLOGY
+from app.nlp import prepare_note, prepare_notes
+
+NOTE = ("History of present illness: 64 year old man with hypertension and "
+        "atrial fibrillation presenting with chest pain. Medications prior "
+        "to admission: aspirin 81 mg daily, metoprolol 25 mg orally, "
+        "lisinopril. Allergies: penicillin. Impression: stable angina.")
+
+MEDICATION_FIELDS = {'name', 'amount', 'unit', 'method'}
+
+
+def check_shape(result):
+    """The shape routes.results and results.html read"""
+    assert set(result) == set(TERMINOLOGY)
+    for section in result.values():
+        assert set(section) == {'text', 'diseases', 'medications'}
+        assert isinstance(section['text'], str)
+        for disease in section['diseases']:
+            assert set(disease) == {'name'}
+            assert isinstance(disease['name'], str)
+        for medication in section['medications']:
+            assert set(medication) == MEDICATION_FIELDS
+            assert isinstance(medication['name'], str)
+
+
+@pytest.fixture(params=['stand_in_model', 'trained_model'])
+def model(request):
+    return request.getfixturevalue(request.param)
+
+
+def test_result_shape(model):
+    for result in (prepare_note(model, NOTE),
+                   prepare_note(model, NOTE, single_pass=False),
+                   prepare_note(model, "no headers here"),
+                   prepare_notes(model, [NOTE, ""])[1]):
+        check_shape(result)
+
+
+def test_sections_and_entities(stand_in_model):
+    result = prepare_note(stand_in_model, NOTE)
+    assert result['allergies'] == {
+        'text': ': penicillin.', 'diseases': [],
+        'medications': [{'name': 'penicillin', 'amount': None,
+                         'unit': None, 'method': None}]}
+    medications = result['medications prior to admission']['medications']
+    assert medications[0] == {'name': 'aspirin', 'amount': '81',
+                              'unit': 'mg', 'method': 'daily'}
+    assert [d['name'] for d in
+            result['history of present illness']['diseases']] == \
+        ['hypertension', 'atrial fibrillation', 'chest pain']
+    assert result['family history']['text'] == "None"
+    assert prepare_note(stand_in_model, NOTE, single_pass=False) == result
@@ -0,0 +1,31 @@
+import pytest
+from flask_login import login_user
+
+from app import application, profiling
+from app.classes import User
+
+
+@pytest.fixture
+def admins(monkeypatch):
+    monkeypatch.setitem(application.config, 'PROFILE_ADMINS', ['admin'])
+
+
+def requested(path, username=None, **kwargs):
+    with application.test_request_context(path, **kwargs):
+        if username is not None:
+            login_user(User(username, 'password'))
+        return profiling.requested()
+
+
+def test_nobody_is_an_admin_by_default():
+    assert application.config['PROFILE_ADMINS'] == []
+    assert not requested('/upload?profile=1', 'admin')
+
+
+def test_only_admins_can_request_a_profile(admins):
+    assert requested('/upload?profile=1', 'admin')
+    assert requested('/upload', 'admin', headers={'X-Profile': '1'})
+    assert not requested('/upload', 'admin')
+    assert not requested('/upload?profile=1', 'physician')
+    assert not requested('/upload', 'physician', headers={'X-Profile': '1'})
+    assert not requested('/upload?profile=1')
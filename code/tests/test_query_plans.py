@@ -0,0 +1,13 @@
+from app import query_plans
+
+
+def test_hot_queries_use_an_index(database):
+    problems = query_plans.check()
+    assert problems == [], "\n".join(
+        "{}:\n{}".format(name, plan) for name, plan in problems)
+
+
+def test_scans_detects_a_full_table_scan(database):
+    plan = query_plans.explain(
+        query_plans.Data.query.filter(query_plans.Data.label == 'disease'))
+    assert query_plans.scans(plan, 'transcriptions')
@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+pytest.importorskip('spacy')
+
+from app.matchers import TERMINOLOGY
+from app.segment import HeaderIndex, split_sections
+
+
+def find_headers(text, terms=TERMINOLOGY):
+    """Reference: every whole-word occurrence of each header found with
+    str.find, then leftmost-longest without overlaps"""
+    lowered = text.lower()
+
+    def boundary(pos):
+        return pos < 0 or pos >= len(text) or not text[pos].isalnum()
+
+    hits = []
+    for term in terms:
+        start = lowered.find(term)
+        while start != -1:
+            end = start + len(term)
+            if boundary(start - 1) and boundary(end):
+                hits.append((start, end, term))
+            start = lowered.find(term, start + 1)
+    hits.sort(key=lambda hit: (hit[0], -hit[1]))
+    headers = []
+    for hit in hits:
+        if not headers or hit[0] >= headers[-1][1]:
+            headers.append(hit)
+    return headers
+
+
+def sections(text):
+    return [(category, text[start:end])
+            for category, start, end in split_sections(text)]
+
+
+def test_matches_str_find_on_random_transcripts():
+    rng = random.Random(0)
+    words = ["patient", "reports", "history", "of", "medical", "past",
+             "family", "social", "review", "systems", "pain", "mg", ".",
+             "Allergies:", "IMPRESSION", "illness", "present"]
+    index = HeaderIndex()
+    for _ in range(500):
+        pieces = [rng.choice(words + TERMINOLOGY)
+                  for _ in range(rng.randint(0, 30))]
+        text = " ".join(piece.upper() if rng.random() < 0.1 else piece
+                        for piece in pieces)
+        assert index.find(text) == find_headers(text), text
+
+
+def test_overlapping_headers():
+    # 'family history' and 'history of present illness' share a word;
+    # the leftmost header wins
+    text = "family history of present illness unremarkable"
+    assert sections(text) == [
+        ('family history', "of present illness unremarkable")]
+    assert HeaderIndex().find("past medical history") == \
+        [(0, 20, 'past medical history')]
+    assert HeaderIndex().find("past medical and surgical history") == \
+        [(0, 33, 'past medical and surgical history')]
+
+
+def test_header_first_and_last():
+    assert sections("Impression") == [('impression', "")]
+    assert sections("Allergies none. Impression") == [
+        ('allergies', "none."), ('impression', "")]
+
+
+def test_text_before_the_first_header_is_dropped():
+    assert sections("dictated by dr smith. Allergies: none") == [
+        ('allergies', ": none")]
+    assert sections("no headers at all") == []
+
+
+def test_repeated_header_keeps_both_spans_in_order():
+    text = "Allergies: none. Impression: fine. Allergies: penicillin"
+    assert sections(text) == [('allergies', ": none."),
+                              ('impression', ": fine."),
+                              ('allergies', ": penicillin")]
+
+
+def test_headers_only_match_whole_words():
+    assert sections("the allergiesx and preimpression") == []
+    assert sections("ALLERGIES:NONE") == [('allergies', ":NONE")]
@@ -0,0 +1,17 @@
+"""Standalone upload worker: python worker.py
+
+Runs the job workers (and the model refresh) without serving web requests,
+so uploads can be processed on as many hosts or processes as needed; claims
+are atomic, so no upload is processed twice. Set ARMR_JOB_WORKERS=0 on the
+web servers to leave all processing to these workers."""
+import os
+import time
+
+os.environ.setdefault("ARMR_JOB_WORKERS", "2")
+
+from app import warm_up
+
+if __name__ == '__main__':
+    warm_up()
+    while True:
+        time.sleep(3600)